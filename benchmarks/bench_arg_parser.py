@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Cost of creating (and rehydrating) applications: the argument parser.
+
+An application's ``argparse`` parser is built from its (recorded) spec once
+per process, and shared (see ``args.parser_for``). This times creating an
+application and parsing its first arguments, with the shared parser and with
+a parser built for every instance (as before), and unpickling an application
+(as ``parallel.ParallelRunner`` workers do) and copying one.
+
+Run from the repository root::
+
+    python benchmarks/bench_arg_parser.py [INSTANCES]
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+import copy
+import pickle
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from finucane.apputils import Application
+from finucane.apputils.args import build_parser
+
+ARGV = ['-vv', '--config', 'app.ini', '--mode', 'fast', '-n', 'input.txt']
+
+
+class BenchApp(Application):
+    def __init__(self, **kwargs):
+        super().__init__(name='bench', default_config_file='app.ini',
+                         profiling=True, **kwargs)
+        self.arg_parser.add_argument('input', help_='the file to read')
+        self.arg_parser.add_restricted_option(
+            'mode', choices=['safe', 'fast'], help_='how to run')
+        self.arg_parser.add_switch('dry run', unix_flag='n',
+                                   help_='do nothing')
+        self.arg_parser.add_option('label', help_='a label for the run')
+
+    def _main(self):
+        return 0
+
+
+def create_and_parse():
+    return BenchApp().arg_parser.parse_args(ARGV)
+
+
+def create_and_parse_unshared():
+    app = BenchApp()
+    return build_parser(app.arg_parser.spec).parse_args(ARGV)
+
+
+def main(instances=2000):
+    app = BenchApp()
+    pickled = pickle.dumps(app)
+    cases = [
+        ('create + parse (shared parser)', create_and_parse),
+        ('create + parse (own parser)', create_and_parse_unshared),
+        ('create', BenchApp),
+        ('unpickle', lambda: pickle.loads(pickled)),
+        ('copy', lambda: copy.copy(app)),
+    ]
+    for name, function in cases:
+        seconds = min(timeit.repeat(function, number=instances, repeat=3))
+        print('{n:>32}: {t:>8.1f} us/instance'.format(
+            n=name, t=seconds / instances * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Size and encoding throughput of the binary record format (``binlog``).
+
+Compares it with ``SocketHandler`` pickles, ``JsonFormatter`` and
+``JsonLinesFormatter``: bytes per record (alone, and in a zlib compressed
+batch of 1000 records, as the batched netlogger sends them), and records
+encoded per second.
+
+Run from the repository root::
+
+    python benchmarks/bench_binlog.py [RECORDS]
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+import zlib
+import logging
+import logging.handlers
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from finucane.apputils.log import JsonFormatter, JsonLinesFormatter
+from finucane.apputils.binlog import BinaryRecordEncoder
+
+try:
+    import orjson  # (used by the formatters, if installed)
+except ImportError:
+    orjson = None
+
+STATIC = [('app_id', 'org.app.0-1-0'), ('instance', 'c0ffee')]
+BATCH = 1000
+
+
+def make_record(index=7):
+    return logging.LogRecord('org.app.0-1-0', logging.INFO, __file__, 42,
+                             'processed item %d of %s', (index, 'batch-3'),
+                             None, func='_main')
+
+
+def main(records=20000):
+    pickler = logging.handlers.SocketHandler('localhost', 0)
+    encoder = BinaryRecordEncoder(static=dict(STATIC))
+    encoder.header()
+    encoders = [
+        ('pickle', pickler.makePickle, None),
+        ('JsonFormatter', lambda r: JsonFormatter().format(r).encode('utf-8'), b'\n'),
+        ('JsonLinesFormatter', lambda r, f=JsonLinesFormatter(static=STATIC):
+            f.format(r).encode('utf-8'), b'\n'),
+        ('binary', encoder.encode, b''),
+    ]
+    batch = [make_record(index) for index in range(BATCH)]
+    record = make_record()
+    for name, encode, separator in encoders:
+        seconds = min(timeit.repeat(lambda: encode(record),
+                                    number=records, repeat=3))
+        if name == 'binary':
+            encoded = [encoder.header()] + [encode(r) for r in batch]
+        else:
+            encoded = [encode(r) for r in batch]
+        compressed = len(zlib.compress((separator or b'').join(encoded), 6))
+        print('{n:>20}: {r:>9.0f} records/s, {b:>5.0f} bytes/record, '
+              '{c:>5.1f} bytes/record zlib batched'.format(
+                  n=name, r=records / seconds,
+                  b=sum(len(e) for e in encoded) / BATCH,
+                  c=compressed / BATCH))
+    print('(orjson {0})'.format('in use' if orjson else 'not installed'))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Resolution cost of layered configuration (``config.LayeredConfig``).
+
+Three files (system, user, project) of a few hundred keys each, environment
+variables and ``--set`` overrides: the time to merge the layers (cold, and
+from the process-wide cache), and the time to read a value, by ``lookup``
+(the precomputed table), by ``get``, and by walking the layers on every
+access (highest precedence first), as a merge-free implementation would.
+
+Run from the repository root::
+
+    python benchmarks/bench_config_layers.py [KEYS_PER_SECTION]
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+import shutil
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from finucane.apputils import config
+from finucane.apputils.config import ApplicationConfig, LayeredConfig
+
+SECTIONS = ['server', 'database', 'cache', 'worker', 'paths']
+PREFIX = 'BENCH_'
+
+
+def write_layers(directory, keys):
+    paths = []
+    for layer, name in enumerate(['system', 'user', 'project']):
+        path = os.path.join(directory, '{n}.ini'.format(n=name))
+        with open(path, 'w') as f:
+            for section in SECTIONS:
+                f.write('[{s}]\n'.format(s=section))
+                # each layer redefines a shrinking share of the keys
+                for key in range(0, keys, layer + 1):
+                    f.write('key{k} = {n}-{k}\n'.format(k=key, n=name))
+        paths.append(path)
+    return paths
+
+
+def main(keys=100):
+    directory = tempfile.mkdtemp()
+    try:
+        paths = write_layers(directory, keys)
+        environ = dict(('{p}{s}_KEY{k}'.format(p=PREFIX, s=section.upper(), k=key),
+                        'env') for section in SECTIONS for key in range(0, keys, 10))
+        overrides = ['{s}.key{k}=cli'.format(s=section, k=key)
+                     for section in SECTIONS for key in range(0, keys, 25)]
+        print('{n} keys in {f} files, {e} environment variables, {o} '
+              'overrides'.format(n=keys * len(SECTIONS), f=len(paths),
+                                 e=len(environ), o=len(overrides)))
+
+        def build():
+            return LayeredConfig(paths, PREFIX, overrides, environ=environ)
+
+        def cold():
+            config.clear_cache()
+            return build()
+
+        for name, function in [('merge (cold)', cold), ('merge (cached)', build)]:
+            seconds = min(timeit.repeat(function, number=20, repeat=3)) / 20
+            print('{n:>16}: {t:>9.1f} us'.format(n=name, t=seconds * 1e6))
+
+        layered = build()
+        layers = [dict(o.split('=') for o in overrides)]
+        layers.append(dict(('{s}.key{k}'.format(s=s.lower(), k=k[3:]), v)
+                           for name, v in environ.items()
+                           for s, k in [name[len(PREFIX):].split('_')]))
+        for path in reversed(paths):
+            layer = ApplicationConfig(path)
+            layers.append(dict(('{s}.{k}'.format(s=s, k=k), v)
+                               for s, options in layer.as_dict().items()
+                               for k, v in options.items()))
+
+        def walk(section, option):
+            name = '{s}.{o}'.format(s=section, o=option)
+            for layer in layers:
+                if name in layer:
+                    return layer[name]
+            return None
+
+        wanted = [(section, 'key{k}'.format(k=key))
+                  for section in SECTIONS for key in range(keys)]
+        assert [layered.lookup(*w) for w in wanted] == [walk(*w) for w in wanted]
+        for name, function in [('lookup', layered.lookup),
+                               ('get', layered.get), ('walk layers', walk)]:
+            seconds = min(timeit.repeat(
+                lambda: [function(*w) for w in wanted], number=20, repeat=3))
+            print('{n:>16}: {t:>9.3f} us/access'.format(
+                n=name, t=seconds / 20 / len(wanted) * 1e6))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Parsing argv with ``args.CompiledParser`` (the fast path) or ``argparse``.
+
+Times parsing typical argvs both ways. (That both give the same results is
+checked by ``tests/test_fast_args.py``.)
+
+Run from the repository root::
+
+    python benchmarks/bench_fast_args.py [PARSES]
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from finucane.apputils import Application
+from finucane.apputils.args import CompiledParser
+
+TYPICAL = [
+    ['input.txt', '2'],
+    ['-vv', '--config', 'app.ini', '--mode', 'fast', '-n', 'input.txt', '3'],
+    ['--label=a', '--label', 'b', '-lc', 'input.txt', '--count', '7', '1'],
+]
+
+
+class BenchApp(Application):
+    def __init__(self, **kwargs):
+        super().__init__(name='bench', default_config_file='app.ini',
+                         profiling=True, **kwargs)
+        self.arg_parser.add_argument('input', help_='the file to read')
+        self.arg_parser.add_argument('level', type_=int, help_='how hard')
+        self.arg_parser.add_restricted_option(
+            'mode', choices=['safe', 'fast'], help_='how to run')
+        self.arg_parser.add_switch('dry run', unix_flag='n',
+                                   help_='do nothing')
+        self.arg_parser.add_option('label', unix_flag='l',
+                                   help_='labels for the run')
+        self.arg_parser.add_option('count', type_=int, default=1,
+                                   help_='how many times')
+
+
+def main(parses=20000):
+    app = BenchApp()
+    compiled = CompiledParser.compile(app.arg_parser.spec)
+    parser = app.arg_parser._arg_parser
+    for argv in TYPICAL:
+        times = []
+        for parse in (compiled.parse, parser.parse_args):
+            times.append(min(timeit.repeat(lambda: parse(argv),
+                                           number=parses, repeat=3)))
+        print('{a:<66} compiled {c:>6.1f} us, argparse {p:>6.1f} us'.format(
+            a=' '.join(argv) or '(none)', c=times[0] / parses * 1e6,
+            p=times[1] / parses * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
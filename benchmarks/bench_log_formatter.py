@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Throughput of ``JsonLinesFormatter`` against ``JsonFormatter``.
+
+Run from the repository root::
+
+    python benchmarks/bench_log_formatter.py [RECORDS]
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+import logging
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from finucane.apputils.log import JsonFormatter, JsonLinesFormatter
+
+try:
+    import orjson  # (used by the formatters, if installed)
+except ImportError:
+    orjson = None
+
+
+def make_record():
+    return logging.LogRecord('org.app.0-1-0', logging.INFO, __file__, 42,
+                             'processed item %d of %s', (7, 'batch-3'), None,
+                             func='_main')
+
+
+def main(records=20000):
+    record = make_record()
+    formatters = [
+        ('JsonFormatter', JsonFormatter()),
+        ('JsonLinesFormatter', JsonLinesFormatter(
+            static=[('app_id', 'org.app.0-1-0'), ('instance', 'c0ffee')])),
+    ]
+    for name, formatter in formatters:
+        seconds = min(timeit.repeat(lambda: formatter.format(record),
+                                    number=records, repeat=3))
+        print('{n:>20}: {r:>10.0f} records/s, {b:>5d} bytes/record'.format(
+            n=name, r=records / seconds, b=len(formatter.format(record))))
+    print('(orjson {0})'.format('in use' if orjson else 'not installed'))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
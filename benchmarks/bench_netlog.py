@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""End-to-end throughput of the netlogger transports, against ``LocalReceiver``.
+
+Run from the repository root::
+
+    python benchmarks/bench_netlog.py [RECORDS]
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+import time
+import logging
+import logging.handlers
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from finucane.apputils.netlog import BatchingNetlogHandler, LocalReceiver
+
+
+def bench(name, make_handler, records):
+    receiver = LocalReceiver()
+    receiver.start()
+    handler = make_handler(receiver.port)
+    log = logging.Logger('bench')
+    log.addHandler(handler)
+
+    started = time.time()
+    for index in range(records):
+        log.info('processed item %d of %s', index, 'batch-3')
+    emitted = time.time()
+    handler.close()
+    received = receiver.wait_for(records)
+    finished = time.time()
+    receiver.stop()
+
+    print('{n:>8}: {e:>9.0f} records/s on the logging thread, '
+          '{d:>9.0f} records/s delivered ({r} of {t})'.format(
+              n=name, e=records / (emitted - started),
+              d=records / (finished - started), r=received, t=records))
+
+
+def main(records=50000):
+    bench('pickle', lambda port: logging.handlers.SocketHandler(
+        'localhost', port), records)
+    bench('batch', lambda port: BatchingNetlogHandler(
+        [('localhost', port)]), records)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Ingest throughput of the netlogger receiver daemon, on one core.
+
+Starts ``python -m finucane.apputils.receiver`` in a subprocess, and points
+several load generator processes at it; each sends pre-encoded batches (so
+the generators are not the bottleneck). The receiver's throughput is the
+number of records on disk over the time it took them to get there.
+
+Run from the repository root::
+
+    python benchmarks/bench_receiver.py [RECORDS [GENERATORS [COMPRESS]]]
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import tempfile
+import subprocess
+import multiprocessing
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, ROOT)
+
+from finucane.apputils.netlog import PREAMBLE, encode_frame
+
+BATCH = 500
+
+
+def make_line(index):
+    return json.dumps({
+        'created': 0.0, 'levelname': 'INFO', 'name': 'bench.app',
+        'message': 'processed item {0} of batch-3'.format(index),
+        'pathname': '/srv/app/worker.py', 'lineno': 120, 'funcName': 'work',
+        'process': 4242, 'threadName': 'MainThread',
+    }, separators=(',', ':')).encode('utf-8')
+
+
+def generate(port, batches, compress):
+    frame = encode_frame([make_line(i) for i in range(BATCH)], compress)
+    sock = socket.create_connection(('localhost', port))
+    sock.sendall(PREAMBLE)
+    for _ in range(batches):
+        sock.sendall(frame)
+    sock.close()
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('localhost', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def main(records=500000, generators=4, compress=1):
+    directory = tempfile.mkdtemp()
+    port = free_port()
+    receiver = subprocess.Popen(
+        [sys.executable, '-m', 'finucane.apputils.receiver',
+         '--host', 'localhost', '--port', str(port),
+         '--directory', directory, '--max-bytes', str(1 << 40),
+         '--stats-interval', '0.05'],
+        cwd=ROOT)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(('localhost', port)).close()
+                break
+            except socket.error:
+                time.sleep(0.05)
+
+        batches = records // BATCH // generators
+        total = batches * BATCH * generators
+        expected = sum(len(make_line(i)) + 1 for i in range(BATCH)) * batches * generators
+        path = os.path.join(directory, 'netlog.jsonl')
+
+        started = time.time()
+        workers = [multiprocessing.Process(target=generate, args=(port, batches, bool(compress)))
+                   for _ in range(generators)]
+        for worker in workers:
+            worker.start()
+        while not os.path.exists(path) or os.path.getsize(path) < expected:
+            time.sleep(0.01)
+        elapsed = time.time() - started
+        for worker in workers:
+            worker.join()
+
+        print('{t} records from {g} generators ({c}): {r:.0f} records/s, '
+              '{m:.1f} MB/s written'.format(
+                  t=total, g=generators, c='zlib' if compress else 'plain',
+                  r=total / elapsed, m=expected / elapsed / 1e6))
+    finally:
+        receiver.terminate()
+        receiver.wait()
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -1,7 +1,4 @@
 # -*- coding: utf-8 -*-
-try:
-    import pkg_resources
-    pkg_resources.declare_namespace(__name__)
-except ImportError:
-    from pkgutil import extend_path
-    __path__ = extend_path(__path__, __name__)
+# ``pkgutil`` style namespace package (``pkg_resources`` is slow to import).
+from pkgutil import extend_path
+__path__ = extend_path(__path__, __name__)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""finucane.apputils.aio
+
+Provides the asyncio flavored application lifecycle (see
+``Application.run_async``).
+
+.. note: This module requires Python 3.5 or newer; it is only imported when
+   ``run_async`` is called.
+
+:copyright: (c) 2014 by Sean Anthony Finucane.
+:license: MIT, see LICENSE for more details.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+import inspect
+
+from .application import RunOutcome
+from .context import RunContext, activate, deactivate
+
+
+async def run_async(app, argv, args, kwargs):
+    """Run ``app`` once, awaiting any coroutine hooks on the current loop.
+
+    Returns:
+        A ``RunOutcome``.
+    """
+    app.app_debug_id = app._make_debug_id(inspect.currentframe())
+
+    report = app._start_report(argv)
+    outcome = None
+    token = activate(RunContext(app))
+    try:
+        app._setup_logging()
+        report.mark('setup_logging')
+        outcome = RunOutcome(argv)
+        await _drive_async(app._lifecycle(outcome, args, kwargs, report))
+        return outcome
+
+    finally:
+        app._teardown_logging()
+        report.mark('teardown_logging')
+        deactivate(token)
+        app._finish_report(report, outcome)
+
+
+async def _drive_async(lifecycle):
+    """Run a ``_lifecycle`` generator to completion, awaiting hook results."""
+    try:
+        value = next(lifecycle)
+        while True:
+            if inspect.isawaitable(value):
+                try:
+                    value = await value
+                except BaseException as e:
+                    # raised at the hook's ``yield`` within the lifecycle
+                    value = lifecycle.throw(e)
+                    continue
+            value = lifecycle.send(value)
+    except StopIteration:
+        pass
@@ -20,12 +20,16 @@ from __future__ import (absolute_import, division, print_function,
 from finucane.apputils.compatibility import upgrade_namespace
 upgrade_namespace(globals())
 
+import os
 import sys
 import logging
-import logging.handlers
+import functools
 import traceback
-import inspect
-from uuid import uuid4 as uuid
+
+# ``logging.handlers``, ``uuid`` and ``inspect`` are rarely needed (netlogger
+# runs, ``uuid``/``id_`` access, and positional constructor arguments), so
+# they are imported when first used; short-lived tools should not pay for
+# them at start-up.
 
 if __python_version__['major'] > 2:
     from io import StringIO
@@ -38,12 +42,57 @@ else:
             self.close()
 
 from .namespace import Namespace, ImmutableNamespace
-from .errors import ApputilsParseError
+from .errors import ApputilsParseError, ApputilsConfigError
 from .args import ArgumentParser
-from .args import NetloggerAddressParse
-from .log import LogAboveErrorFilter
-from .log import JsonFormatter
-from .config import ApplicationConfig
+from .args import NetloggerAddressParse, ConfigOverrideParse
+from .log import RoutingStreamHandler
+from .log import JsonLinesFormatter
+from .log import RunLogger
+from .log import AsyncLogHandler
+from .log import DispatchHandler, RunRecordFilter
+from .log import DuplicateFilter
+from .log import make_log_filters
+from .config import ApplicationConfig, LayeredConfig
+from .config import standard_config_files, env_prefix
+from .context import RunContext, activate, deactivate, current_context
+from .context import attach, detach, bind
+from .context import run_attribute, run_override, lazy_run_attribute
+from .timing import RunReport, NULL_REPORT
+from .profiling import PROFILERS, make_profiler
+
+
+# constructor arguments which are not pickled (see ``_restorable``)
+_STREAMS = ('stdin', 'stdout', 'stderr', 'stdlog')
+
+
+def _restorable(init):
+    """Decorator for the ``__init__`` of application classes.
+
+    Records the (keyword) arguments it is given, less the streams, for
+    ``__getstate__``; while an instance is being unpickled (see
+    ``__setstate__``), the recorded arguments replace those it is given, so
+    the instance is rebuilt as the original was (same options, etc.), even
+    though ``__setstate__`` calls ``__init__()`` without arguments.
+    """
+    code = init.__code__
+    parameters = code.co_varnames[:code.co_argcount]
+
+    @functools.wraps(init)
+    def wrapper(self, *args, **kwargs):
+        if args:
+            import inspect
+            kwargs = inspect.getcallargs(init, self, *args, **kwargs)
+            del kwargs['self']
+        restoring = self.__dict__.get('_restoring')
+        if restoring is not None:
+            kwargs.update((key, value) for key, value in restoring.items()
+                          if key in parameters)
+        init(self, **kwargs)
+        recorded = dict(self.__dict__.get('_init_args') or {})
+        recorded.update((key, value) for key, value in kwargs.items()
+                        if key not in _STREAMS)
+        self._init_args = recorded
+    return wrapper
 
 
 class ApplicationBase(object):
@@ -57,6 +106,34 @@ class ApplicationBase(object):
         app_id: A boolean indicating if we like SPAM or not.
         eggs: An integer count of the eggs we have laid.
     """
+    # the sections/options the config must (or may) have, and their types;
+    # see ``ApplicationConfig.validate``
+    config_schema = None
+
+    # settings which are pickled along with the application (see
+    # ``__getstate__``), as well as its constructor arguments
+    pickled_settings = ('log_queue_size', 'log_overflow', 'netlog_transport',
+                        'netlog_options', 'log_file_options', 'log_limits',
+                        'log_limits_section', 'config_reload_interval',
+                        'config_files', 'config_env_prefix')
+
+    # per-run attributes (see ``context.RunContext``)
+    args = run_attribute('args')
+    config = lazy_run_attribute('config', '_load_config')
+    _config_source = run_attribute('_config_source')
+    log = run_attribute('log')
+    _log_handler = run_attribute('_log_handler')
+    _dispatch_handler = run_attribute('_dispatch_handler')
+    _netlog_handler = run_attribute('_netlog_handler')
+    _file_handler = run_attribute('_file_handler')
+    _async_handler = run_attribute('_async_handler')
+    # per-run overridable attributes (e.g., by ``server.ApplicationServer``)
+    stdin = run_override('stdin')
+    stdout = run_override('stdout')
+    stderr = run_override('stderr')
+    stdlog = run_override('stdlog')
+
+    @_restorable
     def __init__(self, name='', version='0.1.0', description='', epilogue='',
                  stdin=sys.stdin, stdout=sys.stdout, stderr=sys.stderr,
                  stdlog=sys.stderr,
@@ -65,12 +142,16 @@ class ApplicationBase(object):
         self.name = name
 
         self.app_debug_id = None
-        self._stdlog_handler = None
-        self._stderr_handler = None
+        self._log_handler = None
+        self._dispatch_handler = None
         self._netlog_handler = None
+        self._file_handler = None
 
-        self._stdlog_formatter = JsonFormatter()
-        self._stderr_formatter = JsonFormatter()
+        # formatters for stdlog/stderr records; if left as None, a
+        # shared ``JsonLinesFormatter`` is used (see ``_log_formatter``).
+        self._stdlog_formatter = None
+        self._stderr_formatter = None
+        self._default_log_formatter = None
 
         self._version = version
         self._full_name = '{n}, version {v}'.format(n=name, v=version)
@@ -86,8 +167,43 @@ class ApplicationBase(object):
 
         self.args = None
         self.config = None
+        self._config_source = None
         self.log = None
 
+        # assign a ``timing.TimingCollector`` to time each lifecycle phase
+        self.timing = None
+
+        # set ``log_queue_size`` above zero to have log records written on a
+        # background thread (see ``log.AsyncLogHandler``), with the given
+        # overflow policy (one of ``log.OVERFLOW_POLICIES``).
+        self.log_queue_size = 0
+        self.log_overflow = 'block'
+
+        # how ``--netlogger`` records are sent: 'pickle' (one
+        # ``SocketHandler`` per address), or 'batch' (one
+        # ``netlog.BatchingNetlogHandler`` fanning out to every address,
+        # constructed with ``netlog_options`` as keyword arguments).
+        self.netlog_transport = 'pickle'
+        self.netlog_options = {}
+
+        # keyword arguments for the ``logfile.FileLogHandler`` of each
+        # ``--log-file`` (rotation, compression, fsync policy, etc.)
+        self.log_file_options = {}
+
+        # limits on the volume of the run's own log records (see
+        # ``log.make_log_filters`` for the keys). Name a config section in
+        # ``log_limits_section`` to have its settings take precedence (which
+        # means the config is loaded by every run).
+        self.log_limits = {}
+        self.log_limits_section = None
+
+        # set to watch the config file during each run (checking every so
+        # many seconds, where inotify is unavailable), and have changes
+        # swapped in and passed to ``_on_config_change``
+        self.config_reload_interval = None
+
+        # (set ``self.arg_parser.fast`` to parse the usual shapes of argv in
+        # a single pass, without ``argparse``; see ``args.CompiledParser``)
         self.arg_parser = ArgumentParser(prog_name=name,
                                          prog_description=description,
                                          prog_epilogue=epilogue,
@@ -95,8 +211,8 @@ class ApplicationBase(object):
 
         self.state = Namespace()
 
-        # instance UUID:
-        self._uuid = uuid()
+        # instance UUID (generated when first asked for):
+        self._uuid = None
 
     @property
     def version(self):
@@ -124,8 +240,29 @@ class ApplicationBase(object):
 
     @property
     def uuid(self):
+        if self._uuid is None:
+            from uuid import uuid4
+            self._uuid = uuid4()
         return self._uuid
 
+    @property
+    def context(self):
+        """The ``RunContext`` of the calling thread's (or task's) current run.
+
+        None when called from outside of a run.
+        """
+        return current_context(self)
+
+    def submit(self, executor, function, *args, **kwargs):
+        """Submit ``function(*args, **kwargs)`` to a ``concurrent.futures``
+        executor, to be called within the calling thread's run context (so
+        ``self.args``, ``self.config`` and ``self.log`` are this run's).
+
+        Returns:
+            The ``Future``.
+        """
+        return executor.submit(bind(function), *args, **kwargs)
+
     @property
     def app_id(self):
         """A unique identifier string for the APPLICATION (not the instance)."""
@@ -165,6 +302,15 @@ class ApplicationBase(object):
     def _finalization(self):
         pass
 
+    def _on_config_change(self, diff):
+        """Called when the config file changes during a run (see
+        ``config_reload_interval``), with ``self.config`` already swapped for
+        the new version; ``diff`` (a ``watch.ConfigDiff``) says what changed.
+
+        .. note: This is called on the watcher's thread.
+        """
+        pass
+
     def __call__(self, *args, **kwargs):
         """Alias for ``run`` method."""
         return self.run(*args, **kwargs)
@@ -176,6 +322,9 @@ class ApplicationBase(object):
     def run(self, argv=[], *args, **kwargs):
         raise NotImplementedError('Cannot execute purely abstract method!')
 
+    def run_async(self, argv=[], *args, **kwargs):
+        raise NotImplementedError('Cannot execute purely abstract method!')
+
     def __getstate__(self):
         state_data = {k:v for (k,v) in self.state.__dict__.items()
                       if not str(k).startswith('__')}
@@ -185,12 +334,22 @@ class ApplicationBase(object):
         state_data['__description__'] = self.description
         state_data['__epilogue__'] = self.epilogue
         state_data['__credits__'] = self.credits
+        state_data['__init_args__'] = self.__dict__.get('_init_args', {})
+        state_data['__settings__'] = dict(
+            (name, self.__dict__[name]) for name in self.pickled_settings
+            if name in self.__dict__)
 
         return state_data
 
     def __setstate__(self, state):
-        self.__init__()
-        self._name = state.pop('__name__')
+        # (``__init__`` gets the original's arguments; see ``_restorable``)
+        self.__dict__['_restoring'] = state.pop('__init_args__', {})
+        try:
+            self.__init__()
+        finally:
+            del self.__dict__['_restoring']
+        self.__dict__.update(state.pop('__settings__', {}))
+        self.name = state.pop('__name__')
         self._organization = state.pop('__organization__')
         self._version = state.pop('__version__')
         self._description = state.pop('__description__')
@@ -210,10 +369,12 @@ class Application(ApplicationBase):
         likes_spam: A boolean indicating if we like SPAM or not.
         eggs: An integer count of the eggs we have laid.
     """
+    @_restorable
     def __init__(self, name='', version='0.1.0', description='', epilogue='',
                  stdin=sys.stdin, stdout=sys.stdout, stderr=sys.stderr,
                  stdlog=sys.stderr,
-                 credits=None, organization='', default_config_file=None):
+                 credits=None, organization='', default_config_file=None,
+                 profiling=False, layered_config=False):
 
         super().__init__(name=name, version=version, description=description,
                          epilogue=epilogue,
@@ -225,154 +386,709 @@ class Application(ApplicationBase):
             help_='output additional information to stderr (more v\'s mean more output, 4 is maximal)')
 
         # Only enable the config option is the default config is not set to None.
+        # (The file is only read when ``self.config`` is first used.)
         if default_config_file is not None:
             self.arg_parser.add_option(
                 'config',
-                type_=ApplicationConfig,
-                default=ApplicationConfig(default_config_file),
+                default=default_config_file,
                 help_='path to the configuration file.')
 
+        # Layered config: lower precedence files, and environment variables,
+        # beneath the config file (see ``config.LayeredConfig``).
+        self.config_files = []
+        self.config_env_prefix = None
+        if layered_config:
+            self.config_files = standard_config_files(
+                self.name.lower().strip().replace(' ', '-'))
+            self.config_env_prefix = env_prefix(self.name)
+
+        if default_config_file is not None or layered_config:
+            self.arg_parser.add_option(
+                'set', dest='config_overrides', default=None,
+                type_=ConfigOverrideParse,
+                help_='override a configuration value (e.g., "server.port=8080")')
+
         self.arg_parser.add_option(
             'netlogger', dest='netlogger_url',
             default=None, type_=NetloggerAddressParse,
             help_='URL(s) of the socket server(s) to which log events will be sent (e.g., "localhost:9020")')
 
+        self.arg_parser.add_option(
+            'log file', dest='log_file_path', default=None,
+            help_='path(s) of local file(s) to which log events will be appended (as JSON lines)')
+
+        # Only enable the profiling options if asked to.
+        if profiling:
+            self.arg_parser.add_option(
+                'profile', dest='profile_path', default=None,
+                help_='profile the run, and write the profile to this path')
+
+            self.arg_parser.add_restricted_option(
+                'profiler', choices=PROFILERS,
+                help_='the profiler used by --profile: cprofile writes pstats data, sampling writes collapsed stacks (for flame graphs)')
+
     def run(self, argv=[], *args, **kwargs):
+        """Execute the application once, with the given arguments.
+
+        Every run gets its own ``RunContext`` (see ``self.context``), so one
+        instance may be run from several threads at the same time.
 
-        self.app_debug_id = '{c}.{f}'.format(c=str(self.__class__).strip().split("'")[1],
-                                             f=inspect.currentframe().f_code.co_name)
+        Returns:
+            A ``RunOutcome``.
+        """
+        self.app_debug_id = self._make_debug_id(sys._getframe())
 
+        report = self._start_report(argv)
+        outcome = None
+        token = activate(RunContext(self))
         try:
-            # logging facility
-            self.log = logging.getLogger(self.app_id)
-
-            assert self.log is not None
-            assert hasattr(self.log, 'critical')
-            assert hasattr(self.log, 'error')
-            assert hasattr(self.log, 'warning')
-            assert hasattr(self.log, 'info')
-            assert hasattr(self.log, 'debug')
-
-            if self.stdlog is not None:
-                # events with a level above that of ERROR
-                self._stdlog_handler = logging.StreamHandler(self.stdlog)
-                self._stdlog_handler.setFormatter(self._stdlog_formatter)
-                self._stdlog_handler.addFilter(LogAboveErrorFilter())
-                self.log.addHandler(self._stdlog_handler)
-
-            if self.stderr is not None:
-                # events with a level of ERROR and below
-                self._stderr_handler = logging.StreamHandler(self.stderr)
-                self._stderr_handler.setFormatter(self._stderr_formatter)
-                self._stderr_handler.setLevel(logging.ERROR)
-                self.log.addHandler(self._stderr_handler)
-
-            # default logging level before full init is CRITICAL
-            self.log.setLevel(logging.CRITICAL)
-
-            # initialize the application based on given arguments.
-            parsed_args = {}
-            try:
-                parsed_args = self.arg_parser.parse_args(argv)
-            except ApputilsParseError as e:
-                self.log.critical(e)
-                raise e
-
-            # grab things that should NOT be left in the args container
-            if hasattr(parsed_args, 'config'):
-                self.config = parsed_args.config[-1]  # all args are lists!
-                vars(parsed_args)['config'] = None
-
-            else:
-                self.config = ApplicationConfig(file_path=None)
-
-            # all arguments in ``self.args`` must be a list! Make it so.
-            for key, value in vars(parsed_args).items():
-                if not isinstance(value, list):
-                    setattr(parsed_args, key, [value])
-
-            self.args = ImmutableNamespace(default_factory=lambda: [None],
-                                           data=vars(parsed_args))
-
-            # logging configuration details
-            assert hasattr(self.args, 'verbosity')
-
-            logging_level = logging.CRITICAL
-            if self.args.verbosity[-1] == 1:
-                logging_level = logging.ERROR
-            elif self.args.verbosity[-1] == 2:
-                logging_level = logging.WARNING
-            elif self.args.verbosity[-1] == 3:
-                logging_level = logging.INFO
-            elif self.args.verbosity[-1] > 3:
-                logging_level = logging.DEBUG
-
-            self.log.setLevel(logging_level)
-
-            self._netlog_handler = []
-            addresses = []
-            for url in self.args.netlogger_url:
-                if url is not None:
-                    addresses.append({'host': url.hostname, 'port': url.port})
-
-            for address in addresses:
-                if address['host'] is not None and address['port'] is not None:
-                    # a network capable logging facility (remote possibilities, etc.)
-                    self._netlog_handler.append(logging.handlers.SocketHandler(address['host'], address['port']))
-                    self.log.addHandler(self._netlog_handler[-1])
-
-            self.log.debug('Preparing {app_id} environment.'.format(app_id=self.app_debug_id))
+            self._setup_logging()
+            report.mark('setup_logging')
+            outcome = self._run_job(argv, args, kwargs, report)
+            return outcome
 
-            # ready to roll!
-            self.log.debug('Entering {app_id}'.format(app_id=self.app_debug_id))
-            try:
-                assert self.config is not None
-                assert self.args is not None
+        finally:
+            self._teardown_logging()
+            report.mark('teardown_logging')
+            deactivate(token)
+            self._finish_report(report, outcome)
+
+    def run_many(self, jobs, *args, **kwargs):
+        """Execute the application once for every job in ``jobs``.
+
+        The logging facility (including any netlogger connections) is set up
+        once for the whole batch, so that the per-job cost is, more or less,
+        argument parsing plus the lifecycle hooks.
+
+        Each job is either an ``argv`` list, or an ``(argv, kwargs)`` pair;
+        the job's ``kwargs`` are merged over the ``kwargs`` given here, and
+        the result is passed (along with ``*args``) to ``_main``. ``jobs`` may
+        be any iterable, including a generator.
+
+        A job which fails to parse its arguments (or asks for ``--help``) does
+        not abort the batch; its ``SystemExit`` is recorded in its outcome.
+
+        Returns:
+            A list of ``RunOutcome`` instances, one per job, in job order.
+        """
+        self.app_debug_id = self._make_debug_id(sys._getframe())
+
+        outcomes = []
+        # timing of the set-up shared by the whole batch
+        batch_report = self._start_report(None)
+        token = activate(RunContext(self))
+        try:
+            self._setup_logging()
+            batch_report.mark('setup_logging')
+            for index, job in enumerate(jobs):
+                argv, job_kwargs = _split_job(job)
+                main_kwargs = dict(kwargs)
+                main_kwargs.update(job_kwargs)
+                report = self._start_report(argv)
+                try:
+                    outcome = self._run_job(argv, args, main_kwargs, report)
+                except SystemExit as e:
+                    outcome = RunOutcome(argv, exit_status=e.code)
+                outcome.index = index
+                self._finish_report(report, outcome)
+                outcomes.append(outcome)
 
-                self.log.debug('config = {0!s}'.format(self.config.as_dict()))
-                self.log.debug('args = {0!s}'.format(vars(self.args)))
-                self.log.debug('log_name = "{0!s}"'.format(self.log.name))
+        finally:
+            batch_report.lap()
+            self._teardown_logging()
+            batch_report.mark('teardown_logging')
+            deactivate(token)
+            self._finish_report(batch_report, None)
+
+        return outcomes
+
+    def _start_report(self, argv):
+        """Begin timing a run; a no-op report unless ``self.timing`` is set."""
+        if self.timing is None:
+            return NULL_REPORT
+        return RunReport(self.app_id, argv)
+
+    def _finish_report(self, report, outcome):
+        """Complete ``report``, attach it to ``outcome``, and collect it."""
+        if report is NULL_REPORT:
+            return
+        report.finish()
+        if outcome is not None:
+            report.exit_status = outcome.exit_status
+            outcome.report = report
+        self.timing.add(report)
+
+    def _make_debug_id(self, frame):
+        return '{c}.{f}'.format(c=str(self.__class__).strip().split("'")[1],
+                                f=frame.f_code.co_name)
+
+    def _setup_logging(self):
+        """Create the run's logger and attach the stdlog/stderr handler.
+
+        The run's handlers hang off a ``DispatchHandler`` on the application's
+        logger (``logging.getLogger(self.app_id)``), which passes on the
+        records of this run (see ``RunRecordFilter``): those of ``self.log``,
+        and those logged through the application's logger, or its children,
+        during the run.
+        """
+        self.log = self._new_logger()
+
+        assert self.log is not None
+        assert hasattr(self.log, 'critical')
+        assert hasattr(self.log, 'error')
+        assert hasattr(self.log, 'warning')
+        assert hasattr(self.log, 'info')
+        assert hasattr(self.log, 'debug')
+
+        self._dispatch_handler = DispatchHandler()
+        self._dispatch_handler.addFilter(
+            RunRecordFilter(self, self.context, self.log))
+        if self.log_queue_size > 0:
+            self._async_handler = AsyncLogHandler(maxsize=self.log_queue_size,
+                                                  overflow=self.log_overflow)
+            self._dispatch_handler.addHandler(self._async_handler)
+        self.log.parent.addHandler(self._dispatch_handler)
+        sink = self._log_sink()
+
+        if self.stdlog is not None or self.stderr is not None:
+            # events below ERROR go to stdlog, the rest to stderr
+            self._log_handler = RoutingStreamHandler(
+                self.stdlog, self.stderr, split_level=logging.ERROR,
+                low_formatter=self._stdlog_formatter,
+                high_formatter=self._stderr_formatter)
+            self._log_handler.setFormatter(self._log_formatter())
+            sink.addHandler(self._log_handler)
+
+        # netlogger handlers, keyed by (host, port), are created on demand and
+        # kept until tear-down, so a batch of runs connects only once; log
+        # file handlers (keyed by path) likewise.
+        self._netlog_handler = {}
+        self._file_handler = {}
+
+        # default logging level before full init is CRITICAL
+        self.log.setLevel(logging.CRITICAL)
+
+    def _log_sink(self):
+        """Where output handlers go: the async handler, if any, else the
+        run's ``DispatchHandler``."""
+        if self._async_handler is not None:
+            return self._async_handler
+        return self._dispatch_handler
+
+    def _log_formatter(self):
+        """The default formatter: JSON lines, tagged with this instance's ids."""
+        if self._default_log_formatter is None:
+            self._default_log_formatter = JsonLinesFormatter(
+                static=[('app_id', self.app_id), ('instance', str(self.uuid))])
+        return self._default_log_formatter
+
+    def _attach_netloggers(self, urls):
+        """Attach a (cached) ``SocketHandler`` for each of the given URLs.
+
+        Returns:
+            The list of handlers attached (see ``_log_sink``).
+        """
+        addresses = [(url.hostname, url.port) for url in urls
+                     if url is not None and url.hostname is not None and
+                     url.port is not None]
+        if not addresses:
+            return []
+
+        if self.netlog_transport == 'batch':
+            # one handler (and batch) for the whole set of addresses
+            keys = [tuple(sorted(addresses))]
+        else:
+            keys = addresses
+
+        sink = self._log_sink()
+        attached = []
+        for key in keys:
+            handler = self._netlog_handler.get(key)
+            if handler is None:
+                # a network capable logging facility (remote possibilities, etc.)
+                handler = self._new_netlog_handler(key)
+                self._netlog_handler[key] = handler
+            sink.addHandler(handler)
+            attached.append(handler)
+        return attached
+
+    def _new_netlog_handler(self, key):
+        if self.netlog_transport == 'batch':
+            from .netlog import BatchingNetlogHandler
+            return BatchingNetlogHandler(
+                key, formatter=self._log_formatter(), **self.netlog_options)
+        import logging.handlers
+        return logging.handlers.SocketHandler(*key)
+
+    def _attach_log_files(self, paths):
+        """Attach a (cached) ``logfile.FileLogHandler`` for each of the paths.
+
+        A file which cannot be opened is a usage error (as any other bad
+        argument is): it is reported, and ``SystemExit(2)`` raised, before
+        any handler is attached.
+
+        Returns:
+            The list of handlers attached (see ``_log_sink``).
+        """
+        paths = [os.path.abspath(path) for path in paths if path is not None]
+        if not paths:
+            return []
+
+        from .logfile import FileLogHandler
+        attached = []
+        for path in paths:
+            handler = self._file_handler.get(path)
+            if handler is None:
+                try:
+                    handler = FileLogHandler(path, formatter=self._log_formatter(),
+                                             **self.log_file_options)
+                except (IOError, OSError) as e:
+                    self.arg_parser._arg_parser.error(
+                        'argument --log-file: cannot open {p}: {e}'.format(
+                            p=path, e=e.strerror or e))
+                self._file_handler[path] = handler
+            attached.append(handler)
+        sink = self._log_sink()
+        for handler in attached:
+            sink.addHandler(handler)
+        return attached
+
+    def _teardown_logging(self):
+        """Detach (and close) every handler added by ``_setup_logging``."""
+        if self.log is None:
+            return
+
+        sink = self._log_sink()
+        if self._async_handler is not None:
+            # write out everything still queued, before the handlers go
+            self._async_handler.close()
+            dropped = dict(self._async_handler.dropped)
+            if dropped:
+                # (written synchronously, now that the handler is closed)
+                self.log.warning('Log records were dropped (queue full): %r', dropped)
+            self._dispatch_handler.removeHandler(self._async_handler)
+            self._async_handler = None
+
+        if self._log_handler is not None:
+            sink.removeHandler(self._log_handler)
+            self._log_handler.close()  # (writes out what is buffered)
+            self._log_handler = None
+
+        if self._netlog_handler is not None:
+            for handler in self._netlog_handler.values():
+                sink.removeHandler(handler)
+                handler.close()
+            self._netlog_handler = None
+
+        if self._file_handler is not None:
+            for handler in self._file_handler.values():
+                sink.removeHandler(handler)
+                handler.close()
+            self._file_handler = None
+
+        if self._dispatch_handler is not None:
+            self.log.parent.removeHandler(self._dispatch_handler)
+            self._dispatch_handler = None
+
+    def run_async(self, argv=[], *args, **kwargs):
+        """Coroutine counterpart of ``run``, for use on an asyncio event loop.
+
+        Any of the lifecycle hooks (``_initialization``, ``_main``,
+        ``_on_success``, ``_on_failure`` and ``_finalization``) may be
+        coroutine functions; they are awaited on the caller's loop. Each call
+        gets its own run context, so several runs of the same instance may be
+        in flight at once (e.g., via ``asyncio.gather``) without sharing
+        ``self.args``, ``self.config`` or ``self.log``.
+
+        Returns:
+            An awaitable which resolves to a ``RunOutcome``.
+        """
+        # imported here: the ``aio`` module requires Python 3.5 or newer.
+        from .aio import run_async
+        return run_async(self, argv, args, kwargs)
 
-                self.log.debug('Executing initialization hook.')
-                self._initialization()
-                self.log.debug('Executing primary function.')
+    def serve(self, socket_path, forking=False, *args, **kwargs):
+        """Serve runs of this (warm) instance on a Unix domain socket.
 
-                #####
-                self._main(*args, **kwargs)
-                #####
+        Invocations arrive from ``finucane.apputils.client``; see
+        ``server.ApplicationServer`` for the details. ``*args`` and
+        ``**kwargs`` are passed to ``_main`` on every run. Does not return.
+        """
+        from .server import ApplicationServer
+        server = ApplicationServer(self, socket_path, forking=forking,
+                                   args=args, kwargs=kwargs)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+    def _warm(self):
+        """Build, ahead of any run, what runs share and would otherwise build
+        on first use: the argument parser, and the parse of each config file
+        read by default (see ``server.PreforkServer``, whose workers are
+        forked afterwards, and so share them)."""
+        self.arg_parser.prepare()
+        default = self.arg_parser._arg_parser.get_default('config') or []
+        for path in list(self.config_files) + list(default)[-1:]:
+            if path is not None:
+                ApplicationConfig(path)  # (into the parse cache)
+
+    def _new_logger(self):
+        """Create the (unregistered) logger used by a single run.
+
+        Records propagate to ``logging.getLogger(self.app_id)``, where the
+        run's handlers are attached (see ``_setup_logging``), but the level
+        set for one run never leaks into another.
+        """
+        log = RunLogger(self.app_id)
+        log.parent = logging.getLogger(self.app_id)
+        return log
 
-                self.log.debug('Primary function exited cleanly. Executing success hook.')
+    def _run_job(self, argv, args, kwargs, report=NULL_REPORT):
+        """Parse ``argv`` and run the lifecycle hooks, once.
+
+        The logging facility must already be set up (see ``_setup_logging``).
+        The phases of the run are timed into ``report``.
+
+        Returns:
+            A ``RunOutcome``.
+        """
+        outcome = RunOutcome(argv)
+        _drive(self._lifecycle(outcome, args, kwargs, report))
+        return outcome
 
-            except Exception as e:
-                self.log.critical('An exception occurred! Executing failure hook.')
-                self._on_failure()
+    def _prepare_job(self, argv, report=NULL_REPORT):
+        """Parse ``argv`` into ``self.args`` and ``self.config``.
+
+        Returns:
+            The handlers (netlogger and log file), and the log filters,
+            attached for this job.
+        """
+        # default logging level before full init is CRITICAL
+        self.log.setLevel(logging.CRITICAL)
+
+        # initialize the application based on given arguments.
+        try:
+            parsed_args = self.arg_parser.parse_args(argv)
+        except ApputilsParseError as e:
+            self.log.critical(e)
+            raise e
+        report.mark('parse_args')
+
+        # grab things that should NOT be left in the args container; the
+        # config itself is loaded when first used (see ``_load_config``)
+        self.config = None
+        if hasattr(parsed_args, 'config'):
+            self._config_source = parsed_args.config[-1:]  # all args are lists!
+            vars(parsed_args)['config'] = None
+
+        else:
+            self._config_source = []
+
+        # all arguments in ``self.args`` must be a list! Make it so.
+        for key, value in vars(parsed_args).items():
+            if not isinstance(value, list):
+                setattr(parsed_args, key, [value])
+
+        self.args = ImmutableNamespace(default_factory=lambda: [None],
+                                       data=vars(parsed_args))
+
+        # logging configuration details
+        assert hasattr(self.args, 'verbosity')
+
+        level = _verbosity_to_level(self.args.verbosity[-1])
+        self.log.setLevel(level)
+        # (so that children of the application's logger create the records
+        # this run wants; see ``RunRecordFilter``)
+        if level < self.log.parent.getEffectiveLevel():
+            self.log.parent.setLevel(level)
+
+        # (log files first: one which cannot be opened ends the job here)
+        handlers = self._attach_log_files(self.args.log_file_path)
+        handlers += self._attach_netloggers(self.args.netlogger_url)
+
+        log_filters = self._log_filters()
+        for log_filter in log_filters:
+            self.log.addFilter(log_filter)
+        return handlers, log_filters
+
+    def _load_config(self, build=None):
+        """Load the job's config (``self.config`` calls this on first use).
+
+        The config is checked against ``config_schema``, if the class
+        declares one (see ``ApplicationConfig.validate``).
+
+        Args:
+            build: The function which builds the config (by default, the
+                job's ``_config_builder``).
+
+        Returns:
+            An ``ApplicationConfig`` (empty, if there is no config file), or
+            None outside of a job.
+
+        Raises:
+            ApputilsConfigError: The config does not match the schema.
+        """
+        if build is None:
+            build = self._config_builder()
+        if build is None:
+            return None
+        config = build()
+        if self.config_schema is not None:
+            config.validate(self.config_schema)
+        return config
+
+    def _config_builder(self):
+        """A function which (re)builds the job's config from its sources.
+
+        The sources are the config file (``--config``), and, if any are
+        declared, ``config_files`` beneath it, then ``config_env_prefix``
+        variables and ``--set`` overrides above it (a ``LayeredConfig``).
+
+        Returns:
+            The function, or None outside of a job.
+        """
+        source = self._config_source
+        if source is None:
+            return None
+        source = [item for item in source if item is not None]
+        if source and isinstance(source[-1], ApplicationConfig):
+            return lambda: source[-1]
+
+        overrides = [item for item in self.args.config_overrides
+                     if item is not None]
+        env_prefix = self.config_env_prefix
+        if self.config_files or env_prefix or overrides:
+            files = list(self.config_files) + source[-1:]
+            return lambda: LayeredConfig(files, env_prefix, overrides)
+        path = source[-1] if source else None
+        return lambda: ApplicationConfig(file_path=path)
+
+    def _start_config_watcher(self):
+        """Watch the job's config file, if ``config_reload_interval`` is set.
+
+        Returns:
+            The running ``watch.ConfigWatcher``, or None.
+        """
+        if self.config_reload_interval is None:
+            return None
+        # (the highest precedence config file which exists)
+        paths = [item for item in list(self.config_files) + list(self._config_source or [])
+                 if item is not None and not isinstance(item, ApplicationConfig)
+                 and os.path.exists(item)]
+        if not paths:
+            return None
+        build = self._config_builder()
+
+        from .watch import ConfigWatcher
+        context = self.context
+
+        def reload(path):
+            # (validated like the first version; an invalid one is ignored)
+            token = attach(context)
+            try:
+                return self._load_config(build)
+            except ApputilsConfigError as e:
+                self.log.warning('Keeping the current config: %s', e)
+                return None
+            finally:
+                detach(token)
+
+        def changed(config, diff):
+            token = attach(context)
+            try:
+                context.config = config  # (the swap: a single assignment)
+                self._on_config_change(diff)
+            except Exception:
+                self.log.exception('The config change hook failed.')
+            finally:
+                detach(token)
+
+        return ConfigWatcher(paths[-1], changed, current=self.config,
+                             interval=self.config_reload_interval,
+                             factory=reload).start()
+
+    def _log_filters(self):
+        """Build the log volume filters for a job (see ``log_limits``)."""
+        limits = self.log_limits
+        section = self.log_limits_section
+        if section is not None and self.config.has_section(section):
+            limits = dict(limits, **dict(self.config.items(section)))
+        if not limits:
+            return []
+        return make_log_filters(limits)
+
+    def _start_profiler(self):
+        """Start the profiler asked for with ``--profile``, if any.
+
+        Returns:
+            The running profiler, or None.
+        """
+        output_path = self.args.profile_path[-1]
+        if output_path is None:
+            return None
+        profiler = make_profiler(self.args.profiler[-1], output_path)
+        try:
+            profiler.start()
+        except ValueError as e:  # e.g., another profiler is already active
+            self.log.warning('Cannot profile this run: %s', e)
+            return None
+        return profiler
+
+    def _lifecycle(self, outcome, args, kwargs, report=NULL_REPORT):
+        """The lifecycle of a single job, as a generator.
+
+        Each hook's return value is yielded to the driver (``_drive`` or
+        ``aio._drive_async``), which sends back the final value (awaiting it
+        first, if need be). Thus, the sequence of hooks is written only once
+        for both the synchronous and the asynchronous entry points.
+
+        The job's results are recorded in ``outcome`` (a ``RunOutcome``), and
+        the time spent in each phase in ``report``.
+        """
+        try:
+            job_handlers, log_filters = self._prepare_job(outcome.argv, report)
+        except ApputilsParseError as e:
+            outcome.error = e
+            return
+
+        self.log.debug('Preparing %s environment.', self.app_debug_id)
+
+        profiler = watcher = None
+        phase = None
+        try:
+            profiler = self._start_profiler()
+            watcher = self._start_config_watcher()
+
+            # ready to roll!
+            self.log.debug('Entering %s', self.app_debug_id)
+            assert self._config_source is not None
+            assert self.args is not None
+
+            # (these are costly to build, so only when they will be emitted)
+            if self.log.isEnabledFor(logging.DEBUG):
+                self.log.debug('config = %s', self.config.as_dict())
+                self.log.debug('args = %s', vars(self.args))
+                self.log.debug('log_name = "%s"', self.log.name)
+
+            report.mark('prepare')
+
+            phase = 'initialization'
+            self.log.debug('Executing initialization hook.')
+            yield self._initialization()
+            report.mark(phase)
+            phase = 'main'
+            self.log.debug('Executing primary function.')
+
+            #####
+            outcome.result = yield self._main(*args, **kwargs)
+            #####
+
+            report.mark(phase)
+            phase = None
+            self.log.debug('Primary function exited cleanly. Executing success hook.')
+
+        except Exception as e:
+            if phase is not None:
+                report.mark(phase)
+            outcome.error = e
+            self.log.critical('An exception occurred! Executing failure hook.')
+            yield self._on_failure()
+            if self.log.isEnabledFor(logging.CRITICAL):
                 with StringIO() as err_msg:
                     print(e, file=err_msg)
                     traceback.print_exc(file=err_msg)
                     self.log.critical(err_msg.getvalue())
-            else:
-                self.log.debug('Executing success hook.')
-                self._on_success()
-            finally:
+            report.mark('on_failure')
+        else:
+            outcome.succeeded = True
+            self.log.debug('Executing success hook.')
+            yield self._on_success()
+            report.mark('on_success')
+        finally:
+            try:
                 self.log.debug('Executing finalization hook.')
-                self._finalization()
-                self.log.debug('Exiting {app_id}'.format(app_id=self.app_debug_id))
+                yield self._finalization()
+                self.log.debug('Exiting %s', self.app_debug_id)
+            finally:
+                self._end_job(job_handlers, log_filters, profiler, watcher)
+                report.mark('finalization')
+
+    def _end_job(self, job_handlers, log_filters, profiler, watcher):
+        """Undo ``_prepare_job`` and stop the job's helpers (whichever were
+        started): each step runs even if an earlier one fails."""
+        for helper in (watcher, profiler):
+            if helper is not None:
+                try:
+                    helper.stop()
+                except Exception:
+                    self.log.exception('Could not stop %r.', helper)
+        for log_filter in log_filters:
+            self.log.removeFilter(log_filter)
+            if isinstance(log_filter, DuplicateFilter):
+                log_filter.summarize(self.log)
+        for handler in job_handlers:
+            self._log_sink().removeHandler(handler)
+
+
+class RunOutcome(object):
+    """The outcome of a single application run (i.e., one job).
 
-        except ApputilsParseError as e:
-            pass
+    Attributes:
+        argv: The argument list the run was given.
+        succeeded: True if ``_main`` returned without raising.
+        result: The return value of ``_main`` (None on failure).
+        error: The exception raised while parsing or running, if any.
+        index: The position of the job within its batch (None for ``run``).
+        report: The run's ``timing.RunReport``, if timing was enabled.
+    """
+    def __init__(self, argv, succeeded=False, result=None, error=None,
+                 exit_status=None, index=None):
+        self.argv = argv
+        self.index = index
+        self.report = None
+        self.succeeded = succeeded
+        self.result = result
+        self.error = error
+        self._exit_status = exit_status
 
-        finally:
-            # tear-down the logging facility
-            if hasattr(self, '_stdlog_handler') and self._stdlog_handler is not None:
-                self.log.removeHandler(self._stdlog_handler)
-
-            if hasattr(self, '_stderr_handler') and self._stderr_handler is not None:
-                self.log.removeHandler(self._stderr_handler)
-
-            if hasattr(self, '_netlog_handler') and self._netlog_handler is not None:
-                if isinstance(self._netlog_handler, list):
-                    for handler in self._netlog_handler:
-                        self.log.removeHandler(handler)
-                else:
-                    self.log.removeHandler(self._netlog_handler)
-                self._netlog_handler = None
+    @property
+    def exit_status(self):
+        """The process exit status this run would warrant."""
+        if self._exit_status is not None:
+            return self._exit_status
+        return 0 if self.succeeded else 1
+
+    def __repr__(self):
+        return 'RunOutcome(argv={a!r}, succeeded={s!r}, exit_status={x!r})'.format(
+            a=self.argv, s=self.succeeded, x=self.exit_status)
+
+
+def _verbosity_to_level(verbosity):
+    """Map a ``--verbose`` count to a ``logging`` level."""
+    if verbosity is None or verbosity < 1:
+        return logging.CRITICAL
+    elif verbosity == 1:
+        return logging.ERROR
+    elif verbosity == 2:
+        return logging.WARNING
+    elif verbosity == 3:
+        return logging.INFO
+    return logging.DEBUG
+
+
+def _drive(lifecycle):
+    """Run a ``_lifecycle`` generator to completion, synchronously."""
+    try:
+        value = next(lifecycle)
+        while True:
+            value = lifecycle.send(value)
+    except StopIteration:
+        pass
+
+
+def _split_job(job):
+    """Split a ``run_many`` job into its ``(argv, kwargs)`` parts."""
+    if isinstance(job, tuple) and len(job) == 2 and hasattr(job[1], 'keys'):
+        return job[0], job[1]
+    return job, {}
@@ -23,13 +23,10 @@ from finucane.apputils.compatibility import upgrade_namespace
 upgrade_namespace(globals())
 
 import argparse  # included in Python >2.7, but not 2.6
+import threading
 
-if __python_version__['major'] > 2:
-    from urllib.parse import urlparse
-else:
-    from urlparse import urlparse
-
-from .errors import ApputilsParseError
+from .errors import ApputilsParseError, ApputilsConfigError
+from .config import parse_override
 
 
 def NetloggerAddressParse(url, *args, **kwargs):
@@ -48,6 +45,12 @@ def NetloggerAddressParse(url, *args, **kwargs):
     Raises:
         ApputilsParseError
     """
+    # imported here, as only ``--netlogger`` values need it
+    if __python_version__['major'] > 2:
+        from urllib.parse import urlparse
+    else:
+        from urlparse import urlparse
+
     s_url = str(url)
     first_pass = urlparse(s_url)
     # first pass:
@@ -65,6 +68,20 @@ def NetloggerAddressParse(url, *args, **kwargs):
         'Cannot determine hostname/port for given netlogger string: "{url}"'.format(url=url))
 
 
+def ConfigOverrideParse(override):
+    """Checks a ``--set`` value: a 'section.key=value' config override.
+
+    Raises:
+        argparse.ArgumentTypeError (so that a malformed override is a usage
+        error, reported as the argument is parsed)
+    """
+    try:
+        parse_override(override)
+    except ApputilsConfigError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return override
+
+
 # TODO(s.finucane001@gmail.com): replace/improve the ``safe name`` function paradigm!!!
 
 def _make_safe_name(name):
@@ -76,123 +93,455 @@ def _make_option_name(name):
 
 
 class ArgumentParser(object):
-    """
+    """The arguments and options of an application.
+
+    Declarations (``add_argument``, ``add_option``, etc.) are only recorded,
+    as the parser's ``spec``; the ``argparse`` parser is built from the spec
+    when first needed, and shared by every ``ArgumentParser`` with the same
+    spec (in practice, every instance of an application class), so creating,
+    copying and unpickling applications does not build parsers.
+
+    If ``fast`` is set, ``parse_args`` first tries a ``CompiledParser`` (a
+    single pass over argv, for the shapes applications normally use), and
+    only uses ``argparse`` when that gives up (for help, errors, etc.).
+
+    Attributes:
+        spec: The declarations so far (a hashable tuple, see ``parser_for``).
+        fast: Whether to try the compiled parser first.
     """
     def __init__(self, prog_name='', prog_description='', prog_epilogue='',
-                 prog_version=''):
-        self._arg_parser = argparse.ArgumentParser(
-            prog=prog_name, description=prog_description,
-            epilog=prog_epilogue,
-            fromfile_prefix_chars='@')
+                 prog_version='', fast=False):
+        object.__init__(self)
+        self.fast = fast
+        self._header = (prog_name, prog_description, prog_epilogue)
+        self._declarations = []
+        self._parser = None
+        self._compiled = _UNCOMPILED
 
         #self.prog_version = prog_version
 
     @property
     def prog_version(self, value):
-        self._arg_parser.add_argument(
-            '--version', action='version',
-            version='%(prog)s {vers}'.format(vers=value))
+        self._declare(_add_version, value)
+
+    @property
+    def spec(self):
+        return (self._header, tuple(self._declarations))
+
+    @property
+    def _arg_parser(self):
+        """The (shared) ``argparse.ArgumentParser``; do not modify it."""
+        if self._parser is None:
+            self._parser = parser_for(self.spec)
+        return self._parser
+
+    def _declare(self, add, *args):
+        # (lists, e.g. of choices, are stored as tuples, to keep specs hashable)
+        self._declarations.append((add,) + tuple(
+            tuple(arg) if isinstance(arg, list) else arg for arg in args))
+        self._parser = None
+        self._compiled = _UNCOMPILED
+
+    def prepare(self):
+        """Build the parser (and compiled parser) now, not on first use."""
+        self._arg_parser
+        if self.fast and self._compiled is _UNCOMPILED:
+            self._compiled = compiled_parser_for(self.spec)
 
     def parse_args(self, args):
+        if self.fast and args is not None:
+            if self._compiled is _UNCOMPILED:
+                self._compiled = compiled_parser_for(self.spec)
+            if self._compiled is not None:
+                namespace = self._compiled.parse(args)
+                if namespace is not None:
+                    return namespace
         return self._arg_parser.parse_args(args=args)
 
     def add_argument(self, name, help_='', type_=str, nargs=1):
-        safe_name = _make_safe_name(name)
-        self._arg_parser.add_argument(
-            safe_name, metavar=safe_name.upper(), type=type_, nargs=nargs,
-            help=help_)
+        self._declare(_add_argument, name, help_, type_, nargs)
 
     def add_restricted_argument(self, name, choices, help_='', type_=str, nargs=1):
-        safe_name = _make_safe_name(name)
-
-        augmented_help = '{orig} (choices: {c})'.format(orig=help_,
-                                                        c=str(choices).strip().replace('[', '').replace(']', ''))
-
-        self._arg_parser.add_argument(
-            safe_name, metavar=safe_name.upper(), type=type_, nargs=nargs,
-            choices=choices,
-            help=augmented_help)
+        self._declare(_add_restricted_argument, name, choices, help_, type_, nargs)
 
     def add_option(self, name, unix_flag=None, default=None, help_='',
                    type_=str, dest=None):
-
-        safe_name = _make_safe_name(name)
-        if dest is None:
-            dest = safe_name
-
-        optname = _make_option_name(safe_name)
-        if unix_flag is not None:
-            self._arg_parser.add_argument(
-                '-{f}'.format(f=unix_flag),
-                '--{n}'.format(n=optname), dest=dest, action='append',
-                default=[default], type=type_,
-                help=help_)
-        else:
-            self._arg_parser.add_argument(
-                '--{n}'.format(n=optname), dest=dest, action='append',
-                default=[default], type=type_,
-                help=help_)
+        self._declare(_add_option, name, unix_flag, default, help_, type_, dest)
 
     def add_restricted_option(self, name, choices, unix_flag=None, default=None, help_='', type_=str, dest=None):
-        if default is None:
-            default = choices[0]
-
-        safe_name = _make_safe_name(name)
-        if dest is None:
-            dest = safe_name
-
-        optname = _make_option_name(safe_name)
-        if unix_flag is not None:
-            self._arg_parser.add_argument(
-                '-{f}'.format(f=unix_flag),
-                '--{n}'.format(n=optname), dest=dest, action='append',
-                choices=choices,
-                default=default, type=type_,
-                help=help_)
-        else:
-            self._arg_parser.add_argument(
-                '--{n}'.format(n=optname), dest=dest, action='append',
-                choices=choices,
-                default=default, type=type_,
-                help=help_)
+        self._declare(_add_restricted_option, name, choices, unix_flag,
+                      default, help_, type_, dest)
 
     def add_counted_option(self, name, unix_flag=None, default=None, help_='', dest=None):
-        if default is None:
-            default = 0
-
-        safe_name = _make_safe_name(name)
-        if dest is None:
-            dest = safe_name
-
-        optname = _make_option_name(safe_name)
-        if unix_flag is not None:
-            self._arg_parser.add_argument(
-                '-{f}'.format(f=unix_flag),
-                '--{n}'.format(n=optname), dest=dest, action='count',
-                default=default,
-                help=help_)
-        else:
-            self._arg_parser.add_argument(
-                '--{n}'.format(n=optname), dest=dest, action='count',
-                default=default,
-                help=help_)
+        self._declare(_add_counted_option, name, unix_flag, default, help_, dest)
 
     def add_switch(self, name, unix_flag=None, default=None, help_='', dest=None):
-        action = 'store_true'
-        if default:
-            action = 'store_false'
-
-        safe_name = _make_safe_name(name)
-        if dest is None:
-            dest = safe_name
-
-        optname = _make_option_name(safe_name)
-        if unix_flag is not None:
-            self._arg_parser.add_argument(
-                '-{f}'.format(f=unix_flag),
-                '--{n}'.format(n=optname), dest=dest, action=action,
-                help=help_)
+        self._declare(_add_switch, name, unix_flag, default, help_, dest)
+
+
+# built parsers, and compiled parsers, by spec (see ``parser_for``)
+_parsers = {}
+_compiled = {}
+_UNCOMPILED = object()
+_parsers_lock = threading.Lock()
+
+
+def parser_for(spec):
+    """The ``argparse.ArgumentParser`` for a spec (see ``ArgumentParser.spec``).
+
+    Each spec is built once per process; the parser is shared, so it must not
+    be modified. (A spec which is not hashable, e.g. because of a list
+    default, is built every time.)
+    """
+    try:
+        with _parsers_lock:
+            parser = _parsers.get(spec)
+    except TypeError:
+        return build_parser(spec)
+    if parser is None:
+        parser = build_parser(spec)
+        with _parsers_lock:
+            parser = _parsers.setdefault(spec, parser)
+    return parser
+
+
+def compiled_parser_for(spec):
+    """The ``CompiledParser`` for a spec, or None if it cannot be compiled.
+
+    Like ``parser_for``, each spec is compiled once per process.
+    """
+    try:
+        with _parsers_lock:
+            compiled = _compiled.get(spec, _UNCOMPILED)
+    except TypeError:
+        return CompiledParser.compile(spec)
+    if compiled is _UNCOMPILED:
+        compiled = CompiledParser.compile(spec)
+        with _parsers_lock:
+            compiled = _compiled.setdefault(spec, compiled)
+    return compiled
+
+
+def portable_spec(spec):
+    """A spec, with its functions (e.g., each ``type_``) replaced by their
+    names: something which can be compared between processes."""
+    def portable(value):
+        if callable(value):
+            return '{m}.{n}'.format(m=getattr(value, '__module__', None),
+                                    n=getattr(value, '__qualname__',
+                                              getattr(value, '__name__', repr(value))))
+        return value
+    header, declarations = spec
+    return (header, tuple(tuple(portable(item) for item in declaration)
+                          for declaration in declarations))
+
+
+def build_parser(spec):
+    """Build a new ``argparse.ArgumentParser`` from a spec."""
+    (prog_name, prog_description, prog_epilogue), declarations = spec
+    parser = argparse.ArgumentParser(
+        prog=prog_name, description=prog_description,
+        epilog=prog_epilogue,
+        fromfile_prefix_chars='@')
+    for declaration in declarations:
+        declaration[0](parser, *declaration[1:])
+    return parser
+
+
+def _add_version(parser, value):
+    parser.add_argument(
+        '--version', action='version',
+        version='%(prog)s {vers}'.format(vers=value))
+
+
+def _add_argument(parser, name, help_, type_, nargs):
+    safe_name = _make_safe_name(name)
+    parser.add_argument(
+        safe_name, metavar=safe_name.upper(), type=type_, nargs=nargs,
+        help=help_)
+
+
+def _add_restricted_argument(parser, name, choices, help_, type_, nargs):
+    safe_name = _make_safe_name(name)
+
+    augmented_help = '{orig} (choices: {c})'.format(orig=help_,
+                                                    c=str(list(choices)).strip().replace('[', '').replace(']', ''))
+
+    parser.add_argument(
+        safe_name, metavar=safe_name.upper(), type=type_, nargs=nargs,
+        choices=choices,
+        help=augmented_help)
+
+
+def _add_option(parser, name, unix_flag, default, help_, type_, dest):
+    safe_name = _make_safe_name(name)
+    if dest is None:
+        dest = safe_name
+
+    optname = _make_option_name(safe_name)
+    if unix_flag is not None:
+        parser.add_argument(
+            '-{f}'.format(f=unix_flag),
+            '--{n}'.format(n=optname), dest=dest, action='append',
+            default=[default], type=type_,
+            help=help_)
+    else:
+        parser.add_argument(
+            '--{n}'.format(n=optname), dest=dest, action='append',
+            default=[default], type=type_,
+            help=help_)
+
+
+def _add_restricted_option(parser, name, choices, unix_flag, default, help_, type_, dest):
+    if default is None:
+        default = choices[0]
+
+    safe_name = _make_safe_name(name)
+    if dest is None:
+        dest = safe_name
+
+    optname = _make_option_name(safe_name)
+    if unix_flag is not None:
+        parser.add_argument(
+            '-{f}'.format(f=unix_flag),
+            '--{n}'.format(n=optname), dest=dest, action='append',
+            choices=choices,
+            default=[default], type=type_,
+            help=help_)
+    else:
+        parser.add_argument(
+            '--{n}'.format(n=optname), dest=dest, action='append',
+            choices=choices,
+            default=[default], type=type_,
+            help=help_)
+
+
+def _add_counted_option(parser, name, unix_flag, default, help_, dest):
+    if default is None:
+        default = 0
+
+    safe_name = _make_safe_name(name)
+    if dest is None:
+        dest = safe_name
+
+    optname = _make_option_name(safe_name)
+    if unix_flag is not None:
+        parser.add_argument(
+            '-{f}'.format(f=unix_flag),
+            '--{n}'.format(n=optname), dest=dest, action='count',
+            default=default,
+            help=help_)
+    else:
+        parser.add_argument(
+            '--{n}'.format(n=optname), dest=dest, action='count',
+            default=default,
+            help=help_)
+
+
+def _add_switch(parser, name, unix_flag, default, help_, dest):
+    action = 'store_true'
+    if default:
+        action = 'store_false'
+
+    safe_name = _make_safe_name(name)
+    if dest is None:
+        dest = safe_name
+
+    optname = _make_option_name(safe_name)
+    if unix_flag is not None:
+        parser.add_argument(
+            '-{f}'.format(f=unix_flag),
+            '--{n}'.format(n=optname), dest=dest, action=action,
+            help=help_)
+    else:
+        parser.add_argument(
+            '--{n}'.format(n=optname), dest=dest, action=action,
+            help=help_)
+
+
+# the kinds of ``CompiledParser`` flags
+_APPEND, _COUNT, _STORE = range(3)
+
+
+class CompiledParser(object):
+    """A single pass parser of argv, for the usual shapes of a spec.
+
+    Handles positional arguments (of a fixed number of values each), and
+    appended options, counted options and switches, given as ``--name
+    value``, ``--name=value``, ``-f value``, ``-fvalue`` or ``-abc`` (for
+    switches and counted options), in any order. The result is the same
+    ``argparse.Namespace`` that ``argparse`` would give.
+
+    Anything else (help, ``--version``, abbreviated options, ``--``, ``@file``
+    arguments, option values which start with '-', and every error) makes
+    ``parse`` return None, so that the caller can fall back to ``argparse``
+    (which then prints the help, or the error, as usual).
+    """
+    def __init__(self, flags, positionals, defaults):
+        object.__init__(self)
+        self._flags = flags
+        self._positionals = positionals
+        self._defaults = defaults
+
+    @classmethod
+    def compile(cls, spec):
+        """A ``CompiledParser`` for a spec, or None if it has other shapes."""
+        flags = {}
+        positionals = []
+        defaults = {}
+        for declaration in spec[1]:
+            add, args = declaration[0], declaration[1:]
+            if add in (_add_argument, _add_restricted_argument):
+                if add is _add_argument:
+                    name, help_, type_, nargs = args
+                    choices = None
+                else:
+                    name, choices, help_, type_, nargs = args
+                if not isinstance(nargs, int) or nargs < 1:
+                    return None
+                dest = _make_safe_name(name)
+                entry = (dest, nargs, type_, choices)
+                default = None
+            elif add in (_add_option, _add_restricted_option):
+                if add is _add_option:
+                    name, unix_flag, default, help_, type_, dest = args
+                    choices = None
+                else:
+                    name, choices, unix_flag, default, help_, type_, dest = args
+                    if default is None:
+                        default = choices[0]
+                entry = (_APPEND, type_, choices)
+                default = [default]
+            elif add is _add_counted_option:
+                name, unix_flag, default, help_, dest = args
+                entry = (_COUNT, None, None)
+                default = 0 if default is None else default
+            elif add is _add_switch:
+                name, unix_flag, default, help_, dest = args
+                entry = (_STORE, not default, None)
+                default = bool(default)
+            else:
+                return None
+
+            safe_name = _make_safe_name(name)
+            dest = safe_name if dest is None else dest
+            if dest in defaults:
+                return None  # (several arguments share it)
+            defaults[dest] = default
+            if add in (_add_argument, _add_restricted_argument):
+                positionals.append(entry)
+                continue
+            if unix_flag is not None and len(unix_flag) != 1:
+                return None
+            strings = ['--{n}'.format(n=_make_option_name(safe_name))]
+            if unix_flag is not None:
+                strings.append('-{f}'.format(f=unix_flag))
+            for string in strings:
+                if string in flags or string in ('-h', '--help'):
+                    return None  # (``argparse`` deals with conflicts)
+                flags[string] = (entry[0], dest) + entry[1:]
+        return cls(flags, tuple(positionals), defaults)
+
+    def parse(self, argv):
+        """Parse ``argv`` (a list of strings).
+
+        Returns:
+            An ``argparse.Namespace``, or None (see the class docstring).
+        """
+        flags = self._flags
+        values = dict(self._defaults)
+        runs = [[]]  # the positional strings between options
+        index = 0
+        count = len(argv)
+        while index < count:
+            arg = argv[index]
+            index += 1
+            if not arg or arg[0] not in '-@':
+                runs[-1].append(arg)
+                continue
+            if arg[0] == '@':
+                return None
+
+            flag = flags.get(arg)
+            value = None
+            if flag is None:
+                if arg[:2] == '--':
+                    name, equals, value = arg.partition('=')
+                    flag = flags.get(name) if equals else None
+                    if flag is None or flag[0] != _APPEND:
+                        return None
+                elif len(arg) > 2 and '=' not in arg:
+                    flag = flags.get(arg[:2])
+                    if flag is None:
+                        return None
+                    if flag[0] == _APPEND:
+                        value = arg[2:]
+                    else:
+                        # several switches or counted options: -vvn
+                        for letter in arg[1:]:
+                            flag = flags.get('-' + letter)
+                            if flag is None or flag[0] == _APPEND:
+                                return None
+                            self._apply(flag, values)
+                        runs.append([])
+                        continue
+                else:
+                    return None
+
+            if flag[0] == _APPEND:
+                if value is None:
+                    if index == count:
+                        return None
+                    value = argv[index]
+                    index += 1
+                    if value[:1] in ('-', '@'):
+                        return None
+                converted = self._convert(value, flag[2], flag[3])
+                if converted is _INVALID:
+                    return None
+                values[flag[1]] = values[flag[1]] + [converted]
+            else:
+                self._apply(flag, values)
+            runs.append([])
+
+        # each positional takes the next (contiguous) strings it needs
+        positionals = iter(self._positionals)
+        positional = next(positionals, None)
+        for run in runs:
+            start = 0
+            while positional is not None and len(run) - start >= positional[1]:
+                dest, nargs, type_, choices = positional
+                converted = [self._convert(value, type_, choices)
+                             for value in run[start:start + nargs]]
+                if any(value is _INVALID for value in converted):
+                    return None
+                values[dest] = converted
+                start += nargs
+                positional = next(positionals, None)
+            if start != len(run):
+                return None
+        if positional is not None:
+            return None
+        namespace = argparse.Namespace()
+        namespace.__dict__.update(values)
+        return namespace
+
+    @staticmethod
+    def _apply(flag, values):
+        if flag[0] == _COUNT:
+            values[flag[1]] += 1
         else:
-            self._arg_parser.add_argument(
-                '--{n}'.format(n=optname), dest=dest, action=action,
-                help=help_)
+            values[flag[1]] = flag[2]
+
+    @staticmethod
+    def _convert(value, type_, choices):
+        try:
+            value = type_(value)
+        except (argparse.ArgumentTypeError, TypeError, ValueError):
+            return _INVALID
+        if choices is not None and value not in choices:
+            return _INVALID
+        return value
+
+
+_INVALID = object()
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""finucane.apputils.binlog
+
+Provides a compact binary encoding of log records, for the batched netlogger
+transport (``record_format='binary'``, see ``netlog.BatchingNetlogHandler``)
+and the log file sink (see ``logfile.FileLogHandler``), and the means to turn
+it back into JSON lines::
+
+    python -m finucane.apputils.binlog app.log.bin > app.log.jsonl
+
+Format: a stream is a sequence of frames, each a varint length and a body. A
+zero length introduces a header: ``MAGIC``, then a (varint length prefixed)
+JSON object holding the field names, the static fields (e.g., the
+application id) and the base time. Every other frame is one record: the
+values of the header's fields, in order, then a varint count of extra
+``(name, value)`` pairs (e.g., ``exc_text``). Each value is a tag byte and
+its data:
+
+- ``None``, ``False``, ``True``: the tag alone;
+- integers: a zigzag varint;
+- floats: eight bytes (little-endian);
+- ``created``: a zigzag varint of microseconds since the base time;
+- strings: a varint length and UTF-8 data. The strings of ``INTERNED_FIELDS``
+  (logger names, paths, etc.) are numbered as they are first seen, and
+  referred to by number afterwards.
+
+A header resets the numbering, so an encoder starts every stream (each
+connection, each batch, each file) with one, and a decoder may start reading
+at any header.
+
+:copyright: (c) 2014 by Sean Anthony Finucane.
+:license: MIT, see LICENSE for more details.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+# Python 2.6 and newer support
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from finucane.apputils.compatibility import upgrade_namespace
+upgrade_namespace(globals())
+
+import io
+import sys
+import json
+import time
+import struct
+import logging
+
+from .log import JsonLinesFormatter, make_json_encoder
+
+MAGIC = b'APBL\x01'
+
+INTERNED_FIELDS = frozenset(['levelname', 'name', 'pathname', 'filename',
+                             'module', 'funcName', 'threadName', 'processName'])
+
+TAG_NONE = 0
+TAG_FALSE = 1
+TAG_TRUE = 2
+TAG_INT = 3
+TAG_FLOAT = 4
+TAG_STR = 5
+TAG_INTERN = 6  # a string, which is given the next number
+TAG_REF = 7  # the number of an interned string
+TAG_TIME = 8
+
+_VALUE, _INTERNED, _TIME = range(3)
+
+_FLOAT = struct.Struct('<d')
+_SMALL = [bytes(bytearray([n])) for n in range(128)]
+
+
+def _varint(n):
+    if n < 0x80:
+        return _SMALL[n]
+    out = bytearray()
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _zigzag(n):
+    return n << 1 if n >= 0 else ((-n) << 1) - 1
+
+
+def _unzigzag(n):
+    return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+
+class BinaryRecordEncoder(object):
+    """Encodes records as the frames of a binary log stream.
+
+    Not thread safe: the frames of a stream must be encoded in order, by one
+    thread at a time (as handlers do, holding their lock).
+
+    Attributes:
+        fields: The record attributes which are encoded, in order.
+        static: Fields which are the same for every record (sent in headers).
+    """
+    def __init__(self, fields=None, static=None, max_interned=65536):
+        object.__init__(self)
+        self.fields = tuple(fields or JsonLinesFormatter.DEFAULT_FIELDS)
+        self.static = dict(static or {})
+        self.max_interned = max_interned
+        self._formatter = logging.Formatter()
+        self._interned = {}
+        self._base = 0.0
+        # how each field is encoded: as a time, an interned string, or a value
+        self._plan = tuple(
+            (field, _TIME if field == 'created' else
+             _INTERNED if field in INTERNED_FIELDS else _VALUE)
+            for field in self.fields)
+
+    def header(self, base=None):
+        """Start a stream (or a new section of one): return the header frame."""
+        self._base = time.time() if base is None else base
+        self._interned = {}
+        schema = json.dumps({'fields': list(self.fields), 'static': self.static,
+                             'base': self._base},
+                            separators=(',', ':'), default=repr).encode('utf-8')
+        return b'\x00' + MAGIC + _varint(len(schema)) + schema
+
+    def encode(self, record):
+        """Return the frame for one record."""
+        record.message = record.getMessage()
+        attributes = record.__dict__
+        out = bytearray()
+        interned = self._interned
+        for field, kind in self._plan:
+            value = attributes.get(field)
+            # (the common cases are inlined)
+            if kind == _INTERNED and value.__class__ is str and value in interned:
+                out += interned[value]
+            elif kind == _TIME and value.__class__ is float:
+                out.append(TAG_TIME)
+                out += _varint(_zigzag(int(round((value - self._base) * 1e6))))
+            elif kind == _INTERNED and isinstance(value, str):
+                self._encode_interned(value, out)
+            elif value.__class__ is int and value >= 0:
+                out.append(TAG_INT)
+                out += _varint(value << 1)
+            else:
+                self._encode_value(value, out)
+
+        extras = []
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self._formatter.formatException(record.exc_info)
+        if record.exc_text:
+            extras.append(('exc_text', record.exc_text))
+        if attributes.get('stack_info'):  # Python 3.2 and newer
+            extras.append(('stack_info', record.stack_info))
+        out += _SMALL[len(extras)]
+        for name, value in extras:
+            self._encode_interned(name, out)
+            self._encode_value(value, out)
+        return _varint(len(out)) + bytes(out)
+
+    def _encode_interned(self, value, out):
+        ref = self._interned.get(value)
+        if ref is not None:
+            out += ref
+            return
+        if len(self._interned) < self.max_interned:
+            self._interned[value] = _SMALL[TAG_REF] + _varint(len(self._interned))
+            out.append(TAG_INTERN)
+        else:
+            out.append(TAG_STR)
+        data = value.encode('utf-8')
+        out += _varint(len(data))
+        out += data
+
+    def _encode_value(self, value, out):
+        if value is None:
+            out.append(TAG_NONE)
+        elif value is True:
+            out.append(TAG_TRUE)
+        elif value is False:
+            out.append(TAG_FALSE)
+        elif isinstance(value, int):
+            out.append(TAG_INT)
+            out += _varint(_zigzag(value))
+        elif isinstance(value, float):
+            out.append(TAG_FLOAT)
+            out += _FLOAT.pack(value)
+        else:
+            data = (value if isinstance(value, str) else repr(value)).encode('utf-8')
+            out.append(TAG_STR)
+            out += _varint(len(data))
+            out += data
+
+
+class BinaryRecordDecoder(object):
+    """Decodes a binary log stream, fed in pieces, into dicts of fields."""
+    def __init__(self):
+        object.__init__(self)
+        self._pending = b''
+        self._fields = None
+        self._static = {}
+        self._base = 0.0
+        self._interned = []
+
+    def feed(self, data):
+        """Decode as much of the stream as possible; return the records."""
+        buf = self._pending + data
+        records = []
+        position = 0
+        while True:
+            try:
+                length, start = _read_varint(buf, position)
+            except IndexError:
+                break
+            if length == 0:
+                header = self._read_header(buf, start)
+                if header is None:
+                    break
+                position = header
+                continue
+            end = start + length
+            if end > len(buf):
+                break
+            records.append(self._read_record(buf, start, end))
+            position = end
+        self._pending = buf[position:]
+        return records
+
+    def _read_header(self, buf, position):
+        end = position + len(MAGIC)
+        if len(buf) < end:
+            return None
+        if buf[position:end] != MAGIC:
+            raise ValueError('not a binary log stream (bad header)')
+        try:
+            length, start = _read_varint(buf, end)
+        except IndexError:
+            return None
+        if start + length > len(buf):
+            return None
+        schema = json.loads(buf[start:start + length].decode('utf-8'))
+        self._fields = schema['fields']
+        self._static = schema['static']
+        self._base = schema['base']
+        self._interned = []
+        return start + length
+
+    def _read_record(self, buf, position, end):
+        if self._fields is None:
+            raise ValueError('not a binary log stream (no header)')
+        record = dict(self._static)
+        for field in self._fields:
+            record[field], position = self._read_value(buf, position)
+        count, position = _read_varint(buf, position)
+        for _ in range(count):
+            name, position = self._read_value(buf, position)
+            record[name], position = self._read_value(buf, position)
+        if position != end:
+            raise ValueError('malformed binary log record')
+        return record
+
+    def _read_value(self, buf, position):
+        tag = buf[position]
+        if not isinstance(tag, int):
+            tag = ord(tag)  # Python 2.x
+        position += 1
+        if tag == TAG_REF:
+            index, position = _read_varint(buf, position)
+            return self._interned[index], position
+        if tag == TAG_TIME:
+            micros, position = _read_varint(buf, position)
+            return self._base + _unzigzag(micros) / 1e6, position
+        if tag in (TAG_STR, TAG_INTERN):
+            length, position = _read_varint(buf, position)
+            value = buf[position:position + length].decode('utf-8')
+            if tag == TAG_INTERN:
+                self._interned.append(value)
+            return value, position + length
+        if tag == TAG_INT:
+            value, position = _read_varint(buf, position)
+            return _unzigzag(value), position
+        if tag == TAG_FLOAT:
+            return _FLOAT.unpack_from(buf, position)[0], position + _FLOAT.size
+        if tag == TAG_NONE:
+            return None, position
+        if tag == TAG_TRUE:
+            return True, position
+        if tag == TAG_FALSE:
+            return False, position
+        raise ValueError('unknown binary log tag: {0!r}'.format(tag))
+
+
+def _read_varint(buf, position):
+    """Return the varint at ``position``, and the position after it.
+
+    Raises:
+        IndexError: ``buf`` ends before the varint does.
+    """
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[position]
+        if not isinstance(byte, int):
+            byte = ord(byte)  # Python 2.x
+        position += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+def to_json_lines(data, decoder=None):
+    """Decode (a piece of) a binary log stream into JSON lines (bytes)."""
+    encode = make_json_encoder()
+    records = (decoder or BinaryRecordDecoder()).feed(data)
+    return [encode(record).encode('utf-8') for record in records]
+
+
+def convert(source, target, chunk_size=1024 * 1024):
+    """Convert a binary log stream (a binary file) to JSON lines (a text file).
+
+    Returns:
+        The number of records converted.
+    """
+    decoder = BinaryRecordDecoder()
+    encode = make_json_encoder()
+    count = 0
+    while True:
+        data = source.read(chunk_size)
+        if not data:
+            break
+        for record in decoder.feed(data):
+            target.write(encode(record))
+            target.write('\n')
+            count += 1
+    return count
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in ('-h', '--help'):
+        print('usage: {prog} [FILE ...]  (binary log records in, JSON lines '
+              'out; reads stdin if no FILE is given)'.format(prog=sys.argv[0]))
+        return 0
+    target = sys.stdout
+    if not argv:
+        convert(getattr(sys.stdin, 'buffer', sys.stdin), target)
+    for path in argv:
+        with io.open(path, 'rb') as source:
+            convert(source, target)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
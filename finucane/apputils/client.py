@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""finucane.apputils.client
+
+Provides the client half of the resident application server (see
+``finucane.apputils.server``), along with the wire protocol they share.
+
+The client forwards its arguments, environment, working directory and
+standard input to a resident application, relays the application's standard
+output/error back, and exits with the application's exit status::
+
+    python -m finucane.apputils.client /tmp/myapp.sock --verbose some-arg
+
+.. note: To keep the client's own start-up cost down, this module uses the
+   standard library only, and does not upgrade its namespace (``future`` is
+   not imported). It may also be run directly, as a script.
+
+Each frame on the wire is a one byte channel, a four byte (big-endian)
+payload length, and the payload.
+
+:copyright: (c) 2014 by Sean Anthony Finucane.
+:license: MIT, see LICENSE for more details.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+import json
+import socket
+import struct
+import threading
+
+# channels, client to server
+CH_HEADER = b'H'
+CH_STDIN = b'0'
+CH_STDIN_EOF = b'.'
+# channels, server to client
+CH_STDOUT = b'1'
+CH_STDERR = b'2'
+CH_EXIT = b'X'
+
+_FRAME_HEAD = struct.Struct('>cI')
+_CHUNK_SIZE = 65536
+
+
+def send_frame(sock, channel, payload=b''):
+    sock.sendall(_FRAME_HEAD.pack(channel, len(payload)) + payload)
+
+
+def recv_frame(sock):
+    """Receive one frame.
+
+    Returns:
+        A ``(channel, payload)`` tuple, or ``(None, b'')`` at end of stream.
+    """
+    head = _recv_exactly(sock, _FRAME_HEAD.size)
+    if head is None:
+        return None, b''
+    channel, length = _FRAME_HEAD.unpack(head)
+    payload = _recv_exactly(sock, length) if length else b''
+    if payload is None:
+        return None, b''
+    return channel, payload
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _forward_stdin(sock, fd):
+    try:
+        while True:
+            data = os.read(fd, _CHUNK_SIZE)
+            if not data:
+                break
+            send_frame(sock, CH_STDIN, data)
+        send_frame(sock, CH_STDIN_EOF)
+    except (OSError, IOError, socket.error):
+        pass  # the server is done with us
+
+
+def _binary(stream):
+    return getattr(stream, 'buffer', stream)
+
+
+def run(socket_path, argv, stdin=None, stdout=None, stderr=None):
+    """Run ``argv`` on the resident application listening at ``socket_path``.
+
+    Returns:
+        The application's exit status.
+    """
+    stdin = sys.stdin if stdin is None else stdin
+    stdout = _binary(sys.stdout if stdout is None else stdout)
+    stderr = _binary(sys.stderr if stderr is None else stderr)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        header = {'argv': list(argv), 'env': dict(os.environ),
+                  'cwd': os.getcwd()}
+        send_frame(sock, CH_HEADER, json.dumps(header).encode('utf-8'))
+
+        forwarder = threading.Thread(target=_forward_stdin,
+                                     args=(sock, stdin.fileno()))
+        forwarder.daemon = True
+        forwarder.start()
+
+        while True:
+            channel, payload = recv_frame(sock)
+            if channel == CH_STDOUT:
+                stdout.write(payload)
+                stdout.flush()
+            elif channel == CH_STDERR:
+                stderr.write(payload)
+                stderr.flush()
+            elif channel == CH_EXIT:
+                return int(payload)
+            else:
+                stderr.write(b'apputils client: connection lost\n')
+                return 1
+    finally:
+        sock.close()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print('usage: {prog} SOCKET_PATH [ARG ...]'.format(prog=sys.argv[0]),
+              file=sys.stderr)
+        return 2
+    return run(argv[0], argv[1:])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
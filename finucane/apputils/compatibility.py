@@ -18,11 +18,13 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
-from future.builtins import (bytes, dict, int, list, object, range, str,
-                             ascii, chr, hex, input, next, oct, open,
-                             pow, round, super, filter, map, zip)
-
 import sys
+import time
+
+if sys.version_info[0] < 3:
+    from future.builtins import (bytes, dict, int, list, object, range, str,
+                                 ascii, chr, hex, input, next, oct, open,
+                                 pow, round, super, filter, map, zip)
 
 __python_version__ = dict()
 try:
@@ -34,6 +36,11 @@ try:
 except AttributeError:
     __python_version__['minor'] = sys.version_info[1]
 
+try:
+    monotonic = time.monotonic  # Python 3.3 and newer
+except AttributeError:
+    monotonic = time.time
+
 __upgraded__ = ['bytes', 'dict', 'int', 'list', 'object', 'range', 'str',
                  'ascii', 'chr', 'hex', 'input', 'next', 'oct', 'open',
                  'pow', 'round', 'super', 'filter', 'map', 'zip']
@@ -49,6 +56,9 @@ def upgrade_namespace(namespace):
     After this function is called on a namespace, Python 3.x flavored code will
     generally be able to be executed by a Python 2.6 or greater interpreter.
 
+    On Python 3.x, the native builtins already are the upgraded ones, so
+    ``future`` is not imported at all (which keeps start-up cheap).
+
     Example::
 
         from finucane.apputils.compatibility import upgrade_namespace
@@ -61,6 +71,12 @@ def upgrade_namespace(namespace):
     Returns:
         None
     """
+    namespace['__python_version__'] = __python_version__
+
+    if __python_version__['major'] > 2:
+        namespace.setdefault('unicode', str)
+        return
+
     namespace['future'] = __import__('future', globals=namespace,
                                      fromlist=[], level=0)
     enhanced_ = __import__('future.builtins', globals=namespace,
@@ -71,5 +87,3 @@ def upgrade_namespace(namespace):
 
     if 'unicode' not in namespace:
         namespace['unicode'] = namespace['str']
-
-    namespace['__python_version__'] = __python_version__
@@ -5,6 +5,13 @@ Provides customized application configuration facilities and utilities. If a
 customized or enhanced application configuration ability is needed, this is
 where it should exist.
 
+Parsed files are cached for the life of the process, keyed by path and by
+the file's modification time and size: constructing another
+``ApplicationConfig`` for an unchanged file parses nothing, and shares the
+parsed sections until either copy is modified (copy-on-write). With
+``enable_snapshots(directory)``, parsed files are also saved there, so that
+a new process skips the parse as well.
+
 :copyright: (c) 2014 by Sean Anthony Finucane.
 :license: MIT, see LICENSE for more details.
 
@@ -22,29 +29,536 @@ from __future__ import (absolute_import, division, print_function,
 from finucane.apputils.compatibility import upgrade_namespace
 upgrade_namespace(globals())
 
+import os
+import re
+import json
+import threading
+from collections import OrderedDict
+
+from .errors import ApputilsConfigError
+
 try:
     import configparser  # Python 3.x
 except ImportError:
     import ConfigParser as configparser  # Python 2.x
 
 
+# parsed files: (class, absolute path) -> (stamp, defaults, sections); the
+# dicts are shared by every config built from them, until it modifies them
+_parsed = {}
+_parsed_lock = threading.Lock()
+_snapshot_dir = None
+
+
+def enable_snapshots(directory):
+    """Save parsed config files in ``directory``, and load them from there.
+
+    A snapshot is only used while its file's modification time and size are
+    unchanged. Pass None to stop using snapshots.
+    """
+    global _snapshot_dir
+    if directory is not None and not os.path.isdir(directory):
+        os.makedirs(directory)
+    _snapshot_dir = directory
+
+
+def clear_cache():
+    """Forget every parsed (and merged) config file (snapshots on disk are kept)."""
+    with _parsed_lock:
+        _parsed.clear()
+        _merged.clear()
+
+
+def file_stamp(path):
+    """What identifies a version of the file: (mtime, size), or None."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [getattr(stat, 'st_mtime_ns', stat.st_mtime), stat.st_size]
+
+
+def _snapshot_path(key):
+    import hashlib  # (deferred: only snapshots need it)
+    name = '{c}:{p}'.format(c=key[0].__name__, p=key[1]).encode('utf-8')
+    return os.path.join(_snapshot_dir,
+                        hashlib.sha1(name).hexdigest() + '.json')
+
+
+def _load_snapshot(key, stamp):
+    try:
+        with open(_snapshot_path(key), 'r') as snapshot_file:
+            snapshot = json.load(snapshot_file)
+    except (IOError, OSError, ValueError):
+        return None
+    if snapshot.get('stamp') != stamp:
+        return None
+    return snapshot['defaults'], snapshot['sections']
+
+
+def _save_snapshot(key, stamp, defaults, sections):
+    path = _snapshot_path(key)
+    partial = '{p}.{pid}'.format(p=path, pid=os.getpid())
+    try:
+        with open(partial, 'w') as snapshot_file:
+            json.dump({'stamp': stamp, 'defaults': defaults,
+                       'sections': sections}, snapshot_file)
+        os.rename(partial, path)
+    except (IOError, OSError, TypeError, ValueError):
+        pass  # a snapshot is only ever an optimization
+
+
+_MISSING = object()
+
+_DURATION_PART = re.compile(r'\s*([0-9]*\.?[0-9]+)\s*(ms|s|m|h|d|w)?\s*', re.I)
+_DURATION_UNITS = {None: 1.0, 'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0,
+                   'd': 86400.0, 'w': 604800.0}
+
+
+def parse_duration(text):
+    """Seconds in a duration such as '30', '1.5s', '250ms' or '1h 30m'."""
+    seconds = 0.0
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = _DURATION_PART.match(text, position)
+        if match is None or match.end() == position:
+            raise ValueError('not a duration: {0!r}'.format(text))
+        unit = match.group(2).lower() if match.group(2) else None
+        seconds += float(match.group(1)) * _DURATION_UNITS[unit]
+        position = match.end()
+    if not text:
+        raise ValueError('not a duration: {0!r}'.format(text))
+    return seconds
+
+
+def parse_list(text):
+    """The (stripped, non-empty) items of a comma or line separated list."""
+    return [item.strip() for item in re.split(r'[,\n]', text) if item.strip()]
+
+
+def parse_override(override):
+    """Split a 'section.key=value' override (e.g., from ``--set``).
+
+    Returns:
+        A ``(section, key, value)`` tuple (stripped).
+
+    Raises:
+        ApputilsConfigError: The override is not of that form.
+    """
+    target, separator, value = override.partition('=')
+    section, dot, option = target.strip().rpartition('.')
+    if not separator or not dot or not section or not option:
+        raise ApputilsConfigError(
+            'invalid override (expected section.key=value): {0!r}'.format(override))
+    return section, option, value.strip()
+
+
+def _format_value(kind, value):
+    """The text of a (schema default) value, as it would be written in a file."""
+    if isinstance(value, str):
+        return value
+    if kind == 'bool':
+        return 'true' if value else 'false'
+    if kind == 'list':
+        return ', '.join(str(item) for item in value)
+    return str(value)
+
+
 class ApplicationConfig(configparser.ConfigParser):
-    """ """
+    """An INI file configuration, parsed once and read cheaply.
+
+    ``as_dict`` merges the defaults into the sections once (until the config
+    is next modified; each call returns a copy of the result), and
+    the typed getters (``getint``, ``getfloat``, ``getboolean``, ``getlist``
+    and ``getduration``) remember each value they convert, so reading a
+    setting in a loop costs a dictionary lookup.
+    """
+    # the kinds of values a schema (see ``validate``) may name
+    TYPES = ('str', 'int', 'float', 'bool', 'list', 'duration')
+
     def __init__(self, file_path):
-        configparser.ConfigParser.__init__(self)
         self._file_path = file_path
+        self._shared = False
+        self._view = None
+        self._typed = {}
+        configparser.ConfigParser.__init__(self)
         if file_path is not None:
-            self.read(file_path)
+            self._load(file_path)
+
+    def _load(self, file_path):
+        """Read ``file_path``, or adopt the cached parse of it."""
+        if not isinstance(file_path, (str, bytes)) and \
+                not hasattr(file_path, '__fspath__'):
+            self.read(file_path)  # (e.g., several paths)
+            return
+
+        path = os.path.abspath(file_path)
+        stamp = file_stamp(path)
+        if stamp is None:
+            return  # (as ``read`` does, ignore a missing file)
+
+        key = (self.__class__, path)
+        with _parsed_lock:
+            cached = _parsed.get(key)
+        if cached is not None and cached[0] == stamp:
+            self._adopt(cached[1], cached[2])
+            return
+
+        parsed = _load_snapshot(key, stamp) if _snapshot_dir else None
+        if parsed is not None:
+            self._adopt(*parsed)
+        else:
+            self.read(path)
+            if _snapshot_dir:
+                _save_snapshot(key, stamp, self._defaults, self._sections)
+            self._shared = True
+        with _parsed_lock:
+            _parsed[key] = (stamp, self._defaults, self._sections)
+
+    def _adopt(self, defaults, sections):
+        """Use (shared) parsed sections, copying them before any change."""
+        self._defaults = defaults
+        self._sections = sections
+        self._shared = True
+        self._invalidate()
+        proxies = getattr(self, '_proxies', None)  # Python 3.x
+        if proxies is not None:
+            for name in sections:
+                proxies[name] = configparser.SectionProxy(self, name)
+
+    def _modifying(self):
+        """Prepare for a change: stop sharing, and forget derived values."""
+        self._invalidate()
+        if self._shared:
+            self._defaults = self._dict(self._defaults)
+            self._sections = self._dict(
+                (name, self._dict(options))
+                for name, options in self._sections.items())
+            self._shared = False
+
+    # every change to the parsed sections goes through one of these
+    def _read(self, *args, **kwargs):
+        self._modifying()
+        return configparser.ConfigParser._read(self, *args, **kwargs)
+
+    def add_section(self, section):
+        self._modifying()
+        configparser.ConfigParser.add_section(self, section)
+
+    def set(self, section, option, value=None):
+        self._modifying()
+        configparser.ConfigParser.set(self, section, option, value)
+
+    def remove_option(self, section, option):
+        self._modifying()
+        return configparser.ConfigParser.remove_option(self, section, option)
+
+    def remove_section(self, section):
+        self._modifying()
+        return configparser.ConfigParser.remove_section(self, section)
+
+    def read_dict(self, *args, **kwargs):  # Python 3.x
+        self._modifying()
+        return configparser.ConfigParser.read_dict(self, *args, **kwargs)
+
+    def __setitem__(self, key, value):  # Python 3.x
+        self._modifying()
+        return configparser.ConfigParser.__setitem__(self, key, value)
+
+    def __delitem__(self, key):  # Python 3.x
+        self._modifying()
+        return configparser.ConfigParser.__delitem__(self, key)
+
+    def defaults(self):
+        # (the caller may change the dict returned)
+        self._modifying()
+        return configparser.ConfigParser.defaults(self)
+
+    def _invalidate(self):
+        self._view = None
+        self._typed = {}
 
     def as_dict(self):
-        d = dict(self._sections)
-        for k in d:
-            d[k] = dict(self._defaults, **d[k])
-            d[k].pop('__name__', None)
-        return d
+        """Every section, as a dict of its (raw) values, defaults included.
+
+        The merge of each section with the defaults is cached until the
+        config is modified; the dicts returned are copies of it, which the
+        caller may change.
+        """
+        return dict((name, dict(options))
+                    for name, options in self._merged_sections().items())
+
+    def _merged_sections(self):
+        """The (cached, read-only) result of ``as_dict``."""
+        if self._view is None:
+            d = dict(self._sections)
+            for k in d:
+                d[k] = dict(self._defaults, **d[k])
+                d[k].pop('__name__', None)
+            self._view = d
+        return self._view
+
+    def _get_typed(self, kind, convert, section, option, kwargs):
+        """``convert`` the value of an option, remembering the result.
+
+        Only plain reads are remembered (not ``raw`` ones, nor ones with
+        ``vars``); ``fallback``, if given, is returned for a missing option.
+        """
+        if kwargs.get('raw') or kwargs.get('vars') or \
+                set(kwargs) - set(['raw', 'vars', 'fallback']):
+            options = dict(kwargs)
+            fallback = options.pop('fallback', _MISSING)
+            try:
+                return convert(self.get(section, option, **options))
+            except (configparser.NoSectionError, configparser.NoOptionError):
+                if fallback is _MISSING:
+                    raise
+                return fallback
+
+        key = (kind, section, option)
+        try:
+            return self._typed[key]
+        except KeyError:
+            pass
+        try:
+            value = convert(self.get(section, option))
+        except (configparser.NoSectionError, configparser.NoOptionError):
+            if 'fallback' not in kwargs:
+                raise
+            return kwargs['fallback']
+        self._typed[key] = value
+        return value
+
+    def getint(self, section, option, **kwargs):
+        return self._get_typed('int', int, section, option, kwargs)
+
+    def getfloat(self, section, option, **kwargs):
+        return self._get_typed('float', float, section, option, kwargs)
+
+    def getboolean(self, section, option, **kwargs):
+        return self._get_typed('bool', self._to_boolean, section, option, kwargs)
+
+    def getlist(self, section, option, **kwargs):
+        """An option's value as a list (items separated by commas/lines)."""
+        return self._get_typed('list', parse_list, section, option, kwargs)
+
+    def getduration(self, section, option, **kwargs):
+        """An option's value, a duration, in seconds (see ``parse_duration``)."""
+        return self._get_typed('duration', parse_duration, section, option, kwargs)
+
+    def _to_boolean(self, value):
+        states = getattr(self, 'BOOLEAN_STATES', None) or self._boolean_states
+        if value.lower() not in states:
+            raise ValueError('Not a boolean: {0}'.format(value))
+        return states[value.lower()]
+
+    def validate(self, schema):
+        """Check (and convert, warming the getters) the options of ``schema``.
+
+        ``schema`` maps section names to ``{option: kind}``, where the kind is
+        one of ``TYPES``, or a ``(kind, default)`` pair for an optional
+        option, e.g. ``{'server': {'port': 'int', 'timeout': ('duration',
+        '30s')}}``. The defaults of missing options are set in the config
+        (so ``get``, the typed getters and ``as_dict`` all see them).
+
+        Raises:
+            ApputilsConfigError: naming every missing or invalid option.
+        """
+        converters = {'str': str, 'int': int, 'float': float,
+                      'bool': self._to_boolean, 'list': parse_list,
+                      'duration': parse_duration}
+        problems = []
+        defaults = []
+        for section, options in schema.items():
+            for option, kind in options.items():
+                default = _MISSING
+                if isinstance(kind, tuple):
+                    kind, default = kind
+                if kind not in converters:
+                    raise ValueError('unknown config type: {0!r}'.format(kind))
+                try:
+                    self._get_typed(kind, converters[kind], section, option, {})
+                except (configparser.NoSectionError, configparser.NoOptionError):
+                    if default is _MISSING:
+                        problems.append('[{s}] {o}: missing'.format(s=section, o=option))
+                    else:
+                        defaults.append((section, option, kind, default))
+                except ValueError as e:
+                    problems.append('[{s}] {o}: {e}'.format(s=section, o=option, e=e))
+        if problems:
+            raise ApputilsConfigError('invalid config ({p}): {d}'.format(
+                p=self._file_path, d='; '.join(problems)))
+
+        for section, option, kind, default in defaults:
+            self._set_default(section, option, _format_value(kind, default))
+        # (the typed getters are warmed after the last change)
+        for section, option, kind, default in defaults:
+            self._get_typed(kind, converters[kind], section, option, {})
+
+    def _set_default(self, section, option, value):
+        """Set a schema default (copying shared sections first, as ``set``)."""
+        self._modifying()
+        if section != configparser.DEFAULTSECT and not self.has_section(section):
+            configparser.ConfigParser.add_section(self, section)
+        configparser.ConfigParser.set(self, section, option, value)
 
     def __str__(self):
         return 'ApplicationConfig("{path}")'.format(path=self._file_path)
 
     def __repr__(self):
         return self.__str__()
+
+
+def standard_config_files(name):
+    """The system, user and project config files of an application.
+
+    In order of precedence (lowest first): ``/etc/<name>/<name>.ini``,
+    ``~/.config/<name>/<name>.ini`` (or under ``$XDG_CONFIG_HOME``), and
+    ``./<name>.ini``.
+    """
+    file_name = '{n}.ini'.format(n=name)
+    user_dir = os.environ.get('XDG_CONFIG_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.config')
+    return [os.path.join(os.sep, 'etc', name, file_name),
+            os.path.join(user_dir, name, file_name),
+            os.path.join(os.curdir, file_name)]
+
+
+def env_prefix(name):
+    """The environment variable prefix of an application: 'MY_APP_' for 'my-app'."""
+    return re.sub(r'[^A-Za-z0-9]+', '_', name).strip('_').upper() + '_'
+
+
+# merged layers: (class, sources) -> (defaults, sections, provenance, table);
+# the least recently used are dropped beyond _MERGED_MAX (every change to a
+# file, the environment or the overrides makes a new key)
+_merged = OrderedDict()
+_MERGED_MAX = 16
+
+
+class LayeredConfig(ApplicationConfig):
+    """A config merged from several sources, in order of precedence.
+
+    Layers, lowest precedence first: each of ``files`` (missing ones are
+    skipped), then environment variables named ``<env_prefix><SECTION>_<KEY>``
+    (e.g., ``MYAPP_SERVER_PORT=8080``; a section whose name contains ``_`` is
+    matched when the files already have it), then ``overrides``, given as
+    'section.key=value' (e.g., from ``--set``).
+
+    Precedence is resolved once: the merged values land in the (usual)
+    sections, and in a flat table read by ``lookup``. ``provenance`` says
+    where a value came from. The merge is cached for the life of the process,
+    for as long as the files are unchanged (and the environment and overrides
+    are the same).
+    """
+    def __init__(self, files=(), env_prefix=None, overrides=(), environ=None):
+        ApplicationConfig.__init__(self, None)
+        self.files = [os.path.abspath(path) for path in files if path is not None]
+        self._file_path = self.files[-1] if self.files else None
+        self._table = None
+        self._provenance = {}
+
+        environ = os.environ if environ is None else environ
+        variables = tuple(sorted((name, value) for name, value in environ.items()
+                                 if env_prefix and name.startswith(env_prefix)))
+        overrides = tuple(overrides)
+        key = (self.__class__,
+               tuple((path, tuple(file_stamp(path) or ())) for path in self.files),
+               env_prefix, variables, overrides)
+        with _parsed_lock:
+            merged = _merged.pop(key, None)
+            if merged is not None:
+                _merged[key] = merged  # (now the most recently used)
+        if merged is None:
+            self._merge(env_prefix, variables, overrides)
+            merged = (self._defaults, self._sections, self._provenance,
+                      self._flatten())
+            with _parsed_lock:
+                _merged[key] = merged
+                while len(_merged) > _MERGED_MAX:
+                    _merged.popitem(last=False)
+        self._adopt(merged[0], merged[1])
+        self._provenance = merged[2]
+        self._table = merged[3]
+
+    def _merge(self, prefix, variables, overrides):
+        for path in self.files:
+            layer = ApplicationConfig(path)
+            source = 'file:{p}'.format(p=path)
+            for option, value in layer._defaults.items():
+                self._put(configparser.DEFAULTSECT, option, value, source)
+            for section, options in layer._sections.items():
+                for option, value in options.items():
+                    self._put(section, option, value, source)
+
+        sections = sorted(self._sections, key=len, reverse=True)
+        for name, value in variables:
+            rest = name[len(prefix):]
+            for section in sections:
+                if rest.lower().startswith(section.lower() + '_'):
+                    option = rest[len(section) + 1:]
+                    break
+            else:
+                section, _, option = rest.partition('_')
+                section = section.lower()
+            if section and option:
+                self._put(section, option, value, 'env:{n}'.format(n=name))
+
+        for override in overrides:
+            section, option, value = parse_override(override)
+            self._put(section, option, value, 'cli:{o}'.format(o=override))
+
+    def _put(self, section, option, value, source):
+        """Set a merged value (directly: this is a private, unshared config)."""
+        option = self.optionxform(option)
+        if section == configparser.DEFAULTSECT:
+            self._defaults[option] = value
+        else:
+            if section not in self._sections:
+                self._sections[section] = self._dict()
+            self._sections[section][option] = value
+        self._provenance[(section, option)] = source
+
+    def _invalidate(self):
+        ApplicationConfig._invalidate(self)
+        self._table = None
+
+    def set(self, section, option, value=None):
+        ApplicationConfig.set(self, section, option, value)
+        self._provenance = dict(self._provenance)
+        self._provenance[(section, self.optionxform(option))] = 'set'
+
+    def _set_default(self, section, option, value):
+        ApplicationConfig._set_default(self, section, option, value)
+        self._provenance = dict(self._provenance)
+        self._provenance[(section, self.optionxform(option))] = 'default'
+
+    def lookup(self, section, option, default=None):
+        """The (raw) value of an option, by a single dictionary lookup."""
+        table = self._table
+        if table is None:
+            table = self._table = self._flatten()
+        return table.get((section, self.optionxform(option)), default)
+
+    def _flatten(self):
+        return dict(((name, key), value)
+                    for name, options in self._merged_sections().items()
+                    for key, value in options.items())
+
+    def provenance(self, section, option):
+        """Where the value of an option came from (e.g., 'env:MYAPP_A_B').
+
+        Returns:
+            'file:<path>', 'env:<variable>', 'cli:<override>', 'set' or
+            'default' (from a schema, see ``validate``); or
+            None, if the option is not set.
+        """
+        option = self.optionxform(option)
+        source = self._provenance.get((section, option))
+        if source is None:
+            source = self._provenance.get((configparser.DEFAULTSECT, option))
+        return source
+
+    def __str__(self):
+        return 'LayeredConfig({files!r})'.format(files=self.files)
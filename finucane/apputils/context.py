@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""finucane.apputils.context
+
+Provides the ``RunContext`` class, and the machinery which tracks the run
+context that is currently active. This is what allows a single application
+instance to be in the middle of more than one run at the same time (e.g.,
+several threads calling ``run``, or several ``run_async`` calls on one event
+loop). Hooks get at the context of their own run through ``self.context``.
+
+Threads started by a run do not inherit its context; ``bind`` (or
+``Application.submit``) carries it over. A thread which has no run context
+of its own sees the application's run while exactly one is going; with
+none (e.g., once every run is over) or several, it sees the application's
+own attributes (the values the last run to end left behind).
+
+:copyright: (c) 2014 by Sean Anthony Finucane.
+:license: MIT, see LICENSE for more details.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+# Python 2.6 and newer support
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from finucane.apputils.compatibility import upgrade_namespace
+upgrade_namespace(globals())
+from finucane.apputils.compatibility import monotonic
+
+import threading
+import itertools
+import time
+
+try:
+    from contextvars import ContextVar  # Python 3.7 and newer
+except ImportError:
+    ContextVar = None
+
+
+class _ThreadLocalVar(object):
+    """A (minimal) stand-in for ``contextvars.ContextVar`` on older Pythons."""
+    def __init__(self, name, default=None):
+        object.__init__(self)
+        self.name = name
+        self._default = default
+        self._local = threading.local()
+
+    def get(self):
+        return getattr(self._local, 'value', self._default)
+
+    def set(self, value):
+        token = self.get()
+        self._local.value = value
+        return token
+
+    def reset(self, token):
+        self._local.value = token
+
+
+if ContextVar is not None:
+    _current = ContextVar('finucane.apputils.run_context', default=None)
+else:
+    _current = _ThreadLocalVar('finucane.apputils.run_context', default=None)
+
+_run_numbers = itertools.count(1)
+
+
+class RunContext(object):
+    """Holds everything which belongs to a single run of an application.
+
+    Attributes:
+        app: The application instance being run.
+        number: A process-wide serial number for the run.
+        parent: The run context which was active when this one was activated.
+        args: The parsed arguments (an ``ImmutableNamespace``).
+        config: The ``ApplicationConfig`` for the run.
+        log: The logger for the run.
+        overrides: Instance attributes (e.g., ``stdout``) replaced for the
+            duration of the run; see ``run_override``.
+        start_time: The wall-clock time (``time.time``) the run was activated.
+        started: The monotonic clock reading when the run was activated.
+        finished: The monotonic clock reading when the run was deactivated.
+    """
+    def __init__(self, app, **overrides):
+        object.__init__(self)
+        self.app = app
+        self.overrides = overrides
+        self.number = next(_run_numbers)
+        self.parent = None
+        self.start_time = None
+        self.started = None
+        self.finished = None
+        self.args = None
+        self.config = None
+        self._config_source = None
+        self.log = None
+        self._log_handler = None
+        self._dispatch_handler = None
+        self._netlog_handler = None
+        self._file_handler = None
+        self._async_handler = None
+
+    @property
+    def elapsed(self):
+        """Seconds since the run was activated (or its total, once over)."""
+        if self.started is None:
+            return None
+        if self.finished is None:
+            return monotonic() - self.started
+        return self.finished - self.started
+
+    def __repr__(self):
+        return 'RunContext(app={a!r}, number={n!r})'.format(
+            a=getattr(self.app, 'app_id', self.app), n=self.number)
+
+
+def current_context(app):
+    """Return the innermost active ``RunContext`` for ``app``, or None.
+
+    If the calling thread (or task) is not in a run of ``app``, this is the
+    run of ``app`` which is active, if there is exactly one; with several
+    (concurrent runs), it cannot tell which the caller belongs to, and
+    returns None (the caller should ``bind`` or ``attach`` the run's
+    context, to see that run's attributes).
+    """
+    context = _current.get()
+    while context is not None and context.app is not app:
+        context = context.parent
+    if context is None:
+        runs = tuple(getattr(app, '__dict__', {}).get('_active_runs') or ())
+        if len(runs) == 1:
+            return runs[0]
+    return context
+
+
+def activate(context):
+    """Make ``context`` the active run context.
+
+    Returns:
+        A token, to be handed to ``deactivate`` when the run is over.
+    """
+    context.parent = _current.get()
+    context.start_time = time.time()
+    context.started = monotonic()
+    context.app.__dict__.setdefault('_active_runs', []).append(context)
+    return _current.set(context)
+
+
+def deactivate(token):
+    """Restore the run context which was active before ``activate``.
+
+    The run's attributes (see ``run_attribute``) are left on the application
+    instance, where they can be read once the run is over.
+    """
+    context = _current.get()
+    if context is not None:
+        context.finished = monotonic()
+        app = context.app
+        try:
+            app.__dict__.get('_active_runs', []).remove(context)
+        except ValueError:
+            pass
+        for name in _run_attribute_names:
+            if name in context.__dict__:
+                app.__dict__[name] = context.__dict__[name]
+    _current.reset(token)
+
+
+def attach(context):
+    """Make an (already active) ``context`` current in the calling thread too.
+
+    For helper threads working on behalf of a run; unlike ``activate``, the
+    context's timing and parent are left alone.
+
+    Returns:
+        A token, to be handed to ``detach``.
+    """
+    return _current.set(context)
+
+
+def detach(token):
+    """Undo ``attach``."""
+    _current.reset(token)
+
+
+def bind(function, context=None):
+    """Wrap ``function`` so that it runs within a run context, in any thread.
+
+    For handing work to helper threads (e.g., ``threading.Thread(target=
+    bind(work))``); ``context`` defaults to the calling thread's current one.
+    """
+    if context is None:
+        context = _current.get()
+
+    def bound(*args, **kwargs):
+        token = attach(context)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            detach(token)
+    return bound
+
+
+# the names of every ``run_attribute`` (left on the instance by ``deactivate``)
+_run_attribute_names = set()
+
+
+class run_attribute(object):
+    """Descriptor for an application attribute which belongs to a run.
+
+    While a run context for the instance is active, the attribute is read
+    from (and written to) that context. Otherwise, it lives on the instance.
+    """
+    def __init__(self, name):
+        object.__init__(self)
+        self.name = name
+        _run_attribute_names.add(name)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        context = current_context(instance)
+        if context is not None:
+            return getattr(context, self.name)
+        return instance.__dict__.get(self.name)
+
+    def __set__(self, instance, value):
+        context = current_context(instance)
+        if context is not None:
+            setattr(context, self.name, value)
+        else:
+            instance.__dict__[self.name] = value
+
+
+class lazy_run_attribute(run_attribute):
+    """A ``run_attribute`` which is computed when it is first read.
+
+    While the attribute is None, reading it calls the instance's ``loader``
+    method (by name); unless that returns None, its result is stored (as
+    the attribute) and returned.
+    """
+    def __init__(self, name, loader):
+        run_attribute.__init__(self, name)
+        self.loader = loader
+
+    def __get__(self, instance, owner):
+        value = run_attribute.__get__(self, instance, owner)
+        if value is None and instance is not None:
+            value = getattr(instance, self.loader)()
+            if value is not None:
+                self.__set__(instance, value)
+        return value
+
+
+class run_override(object):
+    """Descriptor for an application attribute which a run may override.
+
+    Reads return the value from the innermost active run context (of the
+    instance) which overrides the attribute, or else the instance's own value.
+    Writes always go to the instance.
+    """
+    def __init__(self, name):
+        object.__init__(self)
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        context = current_context(instance)
+        while context is not None:
+            if context.app is instance and self.name in context.overrides:
+                return context.overrides[self.name]
+            context = context.parent
+        return instance.__dict__.get(self.name)
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.name] = value
@@ -34,6 +34,11 @@ class ApputilsParseError(ApputilsError):
     pass
 
 
+class ApputilsConfigError(ApputilsError):
+    """Raised when a configuration does not match its application's schema."""
+    pass
+
+
 class ApplicationError(Exception):
     """ Raised by a developer's application instance when an error occurs."""
     pass
@@ -24,14 +24,471 @@ upgrade_namespace(globals())
 
 import logging
 import json
+import threading
+from collections import deque, defaultdict
 
+from .compatibility import monotonic
+from .context import current_context
 
-class JsonFormatter(logging.Formatter):
+
+def _safe_default(obj):
+    """JSON fallback for values the encoder cannot handle: their ``repr``."""
+    return repr(obj)
+
+
+def make_json_encoder():
+    """Return a function which encodes an object as compact JSON text.
+
+    ``orjson`` is used if it is installed; otherwise, the standard library's
+    encoder is. Either way, values which are not JSON serializable are
+    encoded as their ``repr`` rather than raising.
     """
+    try:
+        import orjson  # optional; a (much) faster JSON encoder
+    except ImportError:
+        orjson = None
+    if orjson is not None:
+        def encode(obj):
+            return orjson.dumps(obj, default=_safe_default).decode('utf-8')
+        return encode
+    return json.JSONEncoder(separators=(',', ':'),
+                            default=_safe_default).encode
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats every attribute of a record as (pretty-printed) JSON.
+
+    .. note: ``JsonLinesFormatter`` is much cheaper, and is what
+       ``Application`` uses.
     """
     def format(self, record):
         """ """
-        return json.dumps(vars(record), indent=1)
+        return json.dumps(vars(record), indent=1, default=_safe_default)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats a record as a single, compact line of JSON (JSON Lines).
+
+    Only the whitelisted ``fields`` of a record are encoded (``message`` is
+    the record's message with its arguments merged in). Exception and stack
+    information are added when present. The ``static`` fields (e.g., the
+    application id) are the same for every record, so they are encoded once,
+    up front, and spliced into each line.
+
+    Attributes:
+        fields: The record attributes which are encoded, in order.
+        static: The static fields.
+    """
+    DEFAULT_FIELDS = ('created', 'levelname', 'name', 'message', 'pathname',
+                      'lineno', 'funcName', 'process', 'threadName')
+
+    def __init__(self, fields=None, static=None, encoder=None):
+        logging.Formatter.__init__(self)
+        self.fields = tuple(fields or self.DEFAULT_FIELDS)
+        self.static = dict(static or {})
+        self._encode = encoder or make_json_encoder()
+        # '"key":value,' for every static field (or nothing)
+        self._static = ''
+        if static:
+            self._static = self._encode(dict(static))[1:-1] + ','
+
+    def format(self, record):
+        record.message = record.getMessage()
+        attributes = record.__dict__
+        data = dict((field, attributes.get(field)) for field in self.fields)
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc_text'] = record.exc_text
+        if attributes.get('stack_info'):  # Python 3.2 and newer
+            data['stack_info'] = self.formatStack(record.stack_info)
+
+        encoded = self._encode(data)
+        if not self._static:
+            return encoded
+        if encoded == '{}':
+            return '{' + self._static[:-1] + '}'
+        return '{' + self._static + encoded[1:]
+
+
+RECORD_FORMATS = ('jsonl', 'binary')
+
+
+def make_record_encoder(record_format, formatter):
+    """The encoder a batching handler uses for ``record_format``.
+
+    Returns:
+        None for 'jsonl' (lines come from the handler's formatter), or a
+        ``binlog.BinaryRecordEncoder`` for 'binary', encoding the fields
+        (and static fields) of ``formatter``, if it has any.
+    """
+    if record_format not in RECORD_FORMATS:
+        raise ValueError('unknown record format: {0!r}'.format(record_format))
+    if record_format == 'jsonl':
+        return None
+    from .binlog import BinaryRecordEncoder
+    return BinaryRecordEncoder(fields=getattr(formatter, 'fields', None),
+                               static=getattr(formatter, 'static', None))
+
+
+OVERFLOW_POLICIES = ('block', 'drop-oldest', 'drop-debug-first')
+
+
+class AsyncLogHandler(logging.Handler):
+    """Hands records to other handlers on a background writer thread.
+
+    ``emit`` only appends the record to a bounded queue, so a slow stream or
+    a stalled log server does not slow down the thread which logs. Records
+    are formatted and written by the writer thread, in order; hence, the
+    arguments of a logging call should not be mutated after the call.
+
+    When the queue is full, the ``overflow`` policy decides what happens:
+
+    * ``block``: the logging thread waits for room (nothing is lost).
+    * ``drop-oldest``: the oldest queued record is discarded.
+    * ``drop-debug-first``: the oldest queued DEBUG (or lower) record is
+      discarded; failing that, an incoming DEBUG record is, and failing that,
+      the oldest queued record is.
+
+    Discarded records are counted, by level name, in ``dropped``.
+
+    The target handlers are managed with ``addHandler``/``removeHandler``,
+    just as on a ``logging.Logger``. ``flush`` waits for the queue to drain;
+    ``close`` drains it, then stops the writer thread (records emitted after
+    that are written synchronously).
+
+    Attributes:
+        maxsize: The capacity of the queue, in records.
+        overflow: One of ``OVERFLOW_POLICIES``.
+        dropped: A dict mapping level names to discarded record counts.
+    """
+    def __init__(self, handlers=(), maxsize=10000, overflow='block'):
+        logging.Handler.__init__(self)
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('overflow policy must be one of {0!r}'.format(
+                OVERFLOW_POLICIES))
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.dropped = defaultdict(int)
+        self._handlers = tuple(handlers)
+        self._queue = deque()
+        self._debug_queued = 0
+        self._unfinished = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._writer = threading.Thread(target=self._write_until_closed,
+                                        name='apputils-log-writer')
+        self._writer.daemon = True
+        self._writer.start()
+
+    def addHandler(self, handler):
+        with self._condition:
+            if handler not in self._handlers:
+                self._handlers += (handler,)
+
+    def removeHandler(self, handler):
+        with self._condition:
+            self._handlers = tuple(h for h in self._handlers if h is not handler)
+
+    @property
+    def handlers(self):
+        return list(self._handlers)
+
+    def emit(self, record):
+        with self._condition:
+            if not self._closed and len(self._queue) >= self.maxsize and \
+                    not self._make_room(record):
+                self.dropped[record.levelname] += 1
+                return
+            # (``close`` may have come while waiting for room: the writer
+            # may be gone, so the record is written here)
+            if not self._closed:
+                self._queue.append(record)
+                if record.levelno <= logging.DEBUG:
+                    self._debug_queued += 1
+                self._unfinished += 1
+                self._condition.notify_all()
+                return
+            handlers = self._handlers
+        _write(record, handlers)
+
+    def _make_room(self, record):
+        """Apply the overflow policy (lock held); False to drop ``record``."""
+        if self.overflow == 'block':
+            while len(self._queue) >= self.maxsize and not self._closed:
+                self._condition.wait()
+            return True
+
+        if self.overflow == 'drop-debug-first':
+            if self._debug_queued:
+                for index, queued in enumerate(self._queue):
+                    if queued.levelno <= logging.DEBUG:
+                        del self._queue[index]
+                        self._discarded(queued)
+                        return True
+            if record.levelno <= logging.DEBUG:
+                return False
+
+        self._discarded(self._queue.popleft())
+        return True
+
+    def _discarded(self, record):
+        self.dropped[record.levelname] += 1
+        self._unfinished -= 1
+        if record.levelno <= logging.DEBUG:
+            self._debug_queued -= 1
+
+    def _write_until_closed(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                batch = list(self._queue)
+                self._queue.clear()
+                self._debug_queued = 0
+                handlers = self._handlers
+                self._condition.notify_all()  # room for blocked producers
+
+            for record in batch:
+                _write(record, handlers)
+
+            with self._condition:
+                self._unfinished -= len(batch)
+                self._condition.notify_all()
+
+    def flush(self):
+        """Wait until every queued record is written, then flush the targets."""
+        with self._condition:
+            while self._unfinished and self._writer.is_alive():
+                self._condition.wait()
+            handlers = self._handlers
+        for handler in handlers:
+            handler.flush()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._writer is not threading.current_thread():
+            self._writer.join()
+        # (anything queued after the writer's last look at the queue)
+        with self._condition:
+            leftover = list(self._queue)
+            self._queue.clear()
+            self._debug_queued = 0
+            self._unfinished = 0
+            handlers = self._handlers
+        for record in leftover:
+            _write(record, handlers)
+        for handler in self._handlers:
+            handler.flush()
+        logging.Handler.close(self)
+
+
+def _write(record, handlers):
+    for handler in handlers:
+        if record.levelno >= handler.level:
+            handler.handle(record)
+
+
+class DispatchHandler(logging.Handler):
+    """Hands records to other handlers, synchronously.
+
+    Like ``AsyncLogHandler`` (without the queue), it has handlers of its own,
+    managed with ``addHandler``/``removeHandler``; so a set of handlers can
+    be attached to (and detached from) a logger, and filtered, as one.
+    """
+    def __init__(self, handlers=()):
+        logging.Handler.__init__(self)
+        self._handlers = tuple(handlers)
+
+    def addHandler(self, handler):
+        if handler not in self._handlers:
+            self._handlers += (handler,)
+
+    def removeHandler(self, handler):
+        self._handlers = tuple(h for h in self._handlers if h is not handler)
+
+    @property
+    def handlers(self):
+        return list(self._handlers)
+
+    def handle(self, record):
+        # (no lock: the handlers lock themselves)
+        if not self.filter(record):
+            return False
+        _write(record, self._handlers)
+        return True
+
+    def emit(self, record):
+        _write(record, self._handlers)
+
+    def flush(self):
+        for handler in self._handlers:
+            handler.flush()
+
+
+class RunRecordFilter(logging.Filter):
+    """Passes the records which belong to one run of an application.
+
+    That is, those logged while the run is the application's current one
+    (see ``context.current_context``), at or above the level of the run's
+    logger. Used on the handler which attaches a run's outputs to the
+    application's (shared) logger, so that records logged through it, or its
+    children, reach the run's outputs, and those of other runs do not.
+    """
+    def __init__(self, app, context, logger):
+        logging.Filter.__init__(self)
+        self.app = app
+        self.context = context
+        self.logger = logger
+
+    def filter(self, record):
+        return (record.levelno >= self.logger.level and
+                current_context(self.app) is self.context)
+
+
+class RoutingStreamHandler(logging.Handler):
+    """Writes records below ``split_level`` to one stream, the rest to another.
+
+    Each record is formatted once, by the formatter for its stream (or the
+    handler's own). Lines for ``low_stream`` are buffered, and written out
+    when ``buffer_size`` characters are pending, at most ``flush_interval``
+    seconds after they were buffered (by a timer, even if no other record
+    follows), on ``flush``, or before any record at ``split_level`` or
+    above, which is written (and flushed) straight away. Either stream may
+    be None, to discard its records.
+    """
+    def __init__(self, low_stream, high_stream, split_level=logging.ERROR,
+                 low_formatter=None, high_formatter=None,
+                 buffer_size=64 * 1024, flush_interval=1.0):
+        logging.Handler.__init__(self)
+        self.low_stream = low_stream
+        self.high_stream = high_stream
+        self.split_level = split_level
+        self.low_formatter = low_formatter
+        self.high_formatter = high_formatter
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._buffered = 0
+        self._written = monotonic()
+        self._timer = None
+
+    def emit(self, record):
+        # (called with the handler's lock held)
+        try:
+            if record.levelno >= self.split_level:
+                if self.high_stream is None:
+                    return
+                line = (self.high_formatter or self).format(record)
+                self._write_buffer()
+                self.high_stream.write(line + '\n')
+                self.high_stream.flush()
+                return
+
+            if self.low_stream is None:
+                return
+            line = (self.low_formatter or self).format(record)
+            self._buffer.append(line)
+            self._buffered += len(line) + 1
+            if (self._buffered >= self.buffer_size or
+                    monotonic() - self._written >= self.flush_interval):
+                self._write_buffer()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval,
+                                              self._timed_flush)
+                self._timer.daemon = True
+                self._timer.start()
+        except Exception:
+            self.handleError(record)
+
+    def _timed_flush(self):
+        try:
+            self.flush()
+        except Exception:
+            pass  # (e.g. the stream was closed at exit)
+
+    def _write_buffer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._buffer:
+            self._buffer.append('')  # the trailing newline
+            self.low_stream.write('\n'.join(self._buffer))
+            self.low_stream.flush()
+            self._buffer = []
+            self._buffered = 0
+        self._written = monotonic()
+
+    def flush(self):
+        self.acquire()
+        try:
+            self._write_buffer()
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        logging.Handler.close(self)
+
+
+class lazy(object):
+    """A log message (or argument) which is only computed if it is emitted.
+
+    ``lazy(function, *args, **kwargs)`` calls ``function`` the first time it
+    is converted to text, which only happens when a handler formats the
+    record; if the level is disabled, it is never called::
+
+        self.log.debug('state = %s', lazy(expensive_dump, self.state))
+    """
+    __slots__ = ('_function', '_args', '_kwargs', '_text')
+
+    def __init__(self, function, *args, **kwargs):
+        self._function = function
+        self._args = args
+        self._kwargs = kwargs
+        self._text = None
+
+    def __str__(self):
+        if self._text is None:
+            self._text = str(self._function(*self._args, **self._kwargs))
+        return self._text
+
+    def __repr__(self):
+        return str(self)
+
+
+class RunLogger(logging.Logger):
+    """A logger for a single application run.
+
+    Run loggers are not registered with the ``logging`` module's manager (so
+    they are freed along with the run), which means the manager does not
+    clear their level cache either; ``setLevel`` does that itself.
+
+    Besides ``%``-style arguments (which are only interpolated if a record
+    is emitted), the message may be a callable taking no arguments, which
+    is likewise only called if the record is emitted::
+
+        self.log.debug(lambda: 'rows = {0!r}'.format(rows))
+
+    .. note: With an ``AsyncLogHandler``, lazy messages are computed on the
+       logging thread, so they should not depend on state the run goes on
+       to mutate.
+    """
+    def setLevel(self, level):
+        logging.Logger.setLevel(self, level)
+        self.__dict__.get('_cache', {}).clear()  # Python 3.7 and newer
+
+    def makeRecord(self, name, level, fn, lno, msg, *args, **kwargs):
+        # only reached when ``level`` is enabled
+        if callable(msg) and not isinstance(msg, lazy):
+            msg = lazy(msg)
+        return logging.Logger.makeRecord(self, name, level, fn, lno, msg,
+                                         *args, **kwargs)
 
 
 class LogAboveErrorFilter(logging.Filter):
@@ -51,3 +508,143 @@ class LogAboveErrorFilter(logging.Filter):
             return 1
         else:
             return 0
+
+
+def _callsite_key(record):
+    return (record.pathname, record.lineno)
+
+
+def _logger_key(record):
+    return record.name
+
+
+# what the volume limiting filters count records by
+FILTER_SCOPES = {'callsite': _callsite_key, 'logger': _logger_key}
+
+
+class RateLimitFilter(logging.Filter):
+    """Limits records to ``rate`` per second (per call site, or per logger).
+
+    A token bucket per key allows bursts of up to ``burst`` records. Records
+    at ``exempt_level`` or above are never limited.
+
+    Attributes:
+        dropped: The number of records filtered out.
+    """
+    def __init__(self, rate, burst=None, per='callsite',
+                 exempt_level=logging.ERROR):
+        logging.Filter.__init__(self)
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self.exempt_level = exempt_level
+        self.dropped = 0
+        self._key = FILTER_SCOPES[per]
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= self.exempt_level:
+            return 1
+        key = self._key(record)
+        now = monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens >= 1.0:
+                bucket[0] = tokens - 1.0
+                return 1
+            bucket[0] = tokens
+            self.dropped += 1
+            return 0
+
+
+class SampleFilter(logging.Filter):
+    """Keeps (at random) one in every ``every`` records.
+
+    Records at ``exempt_level`` or above are always kept.
+    """
+    def __init__(self, every, exempt_level=logging.ERROR):
+        logging.Filter.__init__(self)
+        self.every = int(every)
+        self.exempt_level = exempt_level
+        self._threshold = 1.0 / max(self.every, 1)
+        import random  # (deferred: only sampling needs it)
+        self._random = random.random
+
+    def filter(self, record):
+        if record.levelno >= self.exempt_level:
+            return 1
+        return 1 if self._random() < self._threshold else 0
+
+
+class DuplicateFilter(logging.Filter):
+    """Suppresses repeats of a record (same logger, call site and level).
+
+    The first record of a kind is let through, and repeats are suppressed
+    for ``interval`` seconds; the next one let through afterwards notes how
+    many were suppressed. ``summarize`` reports any still outstanding.
+    """
+    def __init__(self, interval=10.0):
+        logging.Filter.__init__(self)
+        self.interval = float(interval)
+        self._windows = {}  # key: [window start, suppressed count]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.pathname, record.lineno, record.levelno)
+        now = monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is not None and now - window[0] < self.interval:
+                window[1] += 1
+                return 0
+            suppressed = window[1] if window is not None else 0
+            self._windows[key] = [now, 0]
+        if suppressed:
+            record.msg = '{m} [{n} similar messages suppressed]'.format(
+                m=record.msg, n=suppressed)
+        return 1
+
+    def summarize(self, logger):
+        """Send a record for each kind with suppressed (unreported) repeats.
+
+        The records go straight to ``logger``'s handlers, bypassing its
+        filters.
+        """
+        with self._lock:
+            pending = [(key, window[1]) for key, window in self._windows.items()
+                       if window[1]]
+            self._windows.clear()
+        for (name, pathname, lineno, levelno), suppressed in pending:
+            logger.callHandlers(logger.makeRecord(
+                name, levelno, pathname, lineno,
+                '%d similar messages suppressed', (suppressed,), None))
+
+
+def make_log_filters(limits):
+    """Build the volume limiting filters asked for by ``limits``.
+
+    ``limits`` maps (some of) ``rate`` and ``burst`` (see
+    ``RateLimitFilter``), ``sample`` (see ``SampleFilter``), ``dedupe`` (the
+    ``DuplicateFilter`` interval) and ``per`` (``FILTER_SCOPES``) to values,
+    which may be strings (as read from a config file).
+
+    Returns:
+        A list of filters; duplicates are suppressed before sampling or rate
+        limiting, so the suppression summaries see every repeat.
+    """
+    filters = []
+    if limits.get('dedupe'):
+        filters.append(DuplicateFilter(float(limits['dedupe'])))
+    if limits.get('sample'):
+        filters.append(SampleFilter(int(limits['sample'])))
+    if limits.get('rate'):
+        burst = limits.get('burst')
+        filters.append(RateLimitFilter(
+            float(limits['rate']),
+            burst=float(burst) if burst else None,
+            per=limits.get('per') or 'callsite'))
+    return filters
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""finucane.apputils.logfile
+
+Provides ``FileLogHandler``, the handler behind ``--log-file``: records are
+appended (as JSON lines) to a local file, which is the fallback of choice
+when the netlogger is unreachable.
+
+The calling thread only formats the record and appends it to the current
+batch. A writer thread writes each batch with one system call, once it holds
+``buffer_size`` bytes, is ``flush_interval`` seconds old, or holds a record at
+ERROR or above; it also rotates the file (by size, and/or by age), and
+(optionally) gzips rotated segments on yet another thread. How often the file
+is fsync'ed is up to the ``fsync`` policy (one of ``FSYNC_POLICIES``):
+
+- ``never``: leave it to the operating system;
+- ``error``: after writing any batch with a record at ERROR or above;
+- ``interval``: at most every ``fsync_interval`` seconds.
+
+With ``record_format='binary'``, records are written in the compact
+``binlog`` encoding instead of JSON lines (every batch starts a new binlog
+section, so rotation never splits one); ``python -m finucane.apputils.binlog``
+converts such files back to JSON lines.
+
+:copyright: (c) 2014 by Sean Anthony Finucane.
+:license: MIT, see LICENSE for more details.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+# Python 2.6 and newer support
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from finucane.apputils.compatibility import upgrade_namespace
+upgrade_namespace(globals())
+from finucane.apputils.compatibility import monotonic
+
+import os
+import re
+import gzip
+import time
+import shutil
+import logging
+import threading
+
+from .log import JsonLinesFormatter, make_record_encoder
+
+FSYNC_POLICIES = ['never', 'error', 'interval']
+
+
+class FileLogHandler(logging.Handler):
+    """Appends records to a file, in large batches written off-thread.
+
+    Attributes:
+        path: The file written to (rotated segments sit beside it, named
+            ``<path>.<YYYYmmdd-HHMMSS>``, plus ``.gz`` if compressed).
+        max_bytes: The file is rotated once it is this large (0: never).
+        rotate_interval: ... or once it is this many seconds old (None:
+            never).
+        backups: The number of rotated segments kept.
+        record_format: 'jsonl' or 'binary' (see above).
+    """
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, rotate_interval=None,
+                 backups=10, compress=False, fsync='never', fsync_interval=1.0,
+                 buffer_size=1024 * 1024, flush_interval=0.5, formatter=None,
+                 record_format='jsonl'):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError('unknown fsync policy: {0!r}'.format(fsync))
+        logging.Handler.__init__(self)
+        self.setFormatter(formatter or JsonLinesFormatter())
+        self.path = os.path.abspath(path)
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backups = backups
+        self.compress = compress
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.record_format = record_format
+        self._encoder = make_record_encoder(record_format, self.formatter)
+
+        self._lines = []
+        self._size = 0
+        self._oldest = None
+        self._urgent = False
+        self._closed = False
+        self._condition = threading.Condition()
+        # held from cutting a batch until it is written, so batches land in
+        # the order they were cut (by the writer thread, or by ``flush``)
+        self._batch_lock = threading.Lock()
+
+        # the file, and everything done to it, is guarded by ``_file_lock``
+        self._file_lock = threading.Lock()
+        self._file = None
+        self._file_size = 0
+        self._opened = None
+        self._synced = monotonic()
+        self._compressors = []
+        self._open()
+
+        self._writer = threading.Thread(target=self._write_until_closed,
+                                        name='apputils-logfile-writer')
+        self._writer.daemon = True
+        self._writer.start()
+
+    def emit(self, record):
+        if self._encoder is None:
+            try:
+                line = self.format(record).encode('utf-8')
+            except Exception:
+                self.handleError(record)
+                return
+        with self._condition:
+            if self._encoder is not None:
+                # (encoded with the lock held: the batch is a binlog section)
+                try:
+                    if not self._lines:
+                        self._lines.append(self._encoder.header())
+                    line = self._encoder.encode(record)
+                except Exception:
+                    self.handleError(record)
+                    return
+            if self._oldest is None:
+                # a new batch: the writer must start its flush_interval clock
+                self._oldest = monotonic()
+                self._condition.notify()
+            self._lines.append(line)
+            self._size += len(line) + 1
+            if record.levelno >= logging.ERROR:
+                self._urgent = True
+                self._condition.notify()
+            elif self._size >= self.buffer_size:
+                self._condition.notify()
+
+    def _take_batch(self):
+        """Cut the current batch (lock held)."""
+        batch = (self._lines, self._urgent)
+        self._lines = []
+        self._size = 0
+        self._oldest = None
+        self._urgent = False
+        return batch
+
+    def _write_until_closed(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if self._urgent or self._size >= self.buffer_size:
+                        break
+                    if self._oldest is not None:
+                        timeout = self._oldest + self.flush_interval - monotonic()
+                        if timeout <= 0:
+                            break
+                    else:
+                        timeout = None
+                    self._condition.wait(timeout)
+                closed = self._closed
+            self._write_batch()
+            if closed:
+                return
+
+    def _write_batch(self):
+        with self._batch_lock:
+            with self._condition:
+                lines, urgent = self._take_batch()
+            if lines:
+                self._write(lines, urgent)
+
+    def _write(self, lines, urgent):
+        if self._encoder is None:
+            lines.append(b'')  # the trailing newline
+            data = b'\n'.join(lines)
+        else:
+            data = b''.join(lines)
+        with self._file_lock:
+            if self._due_for_rotation(len(data)):
+                self._rotate()
+            self._file.write(data)
+            self._file_size += len(data)
+            now = monotonic()
+            if ((self.fsync == 'error' and urgent) or
+                    (self.fsync == 'interval' and
+                     now - self._synced >= self.fsync_interval)):
+                os.fsync(self._file.fileno())
+                self._synced = now
+
+    def _open(self):
+        # (unbuffered: every batch is already one large write)
+        self._file = open(self.path, 'ab', buffering=0)
+        self._file_size = self._file.tell()
+        self._opened = monotonic()
+
+    def _due_for_rotation(self, incoming):
+        if self.max_bytes and self._file_size and \
+                self._file_size + incoming > self.max_bytes:
+            return True
+        return (self.rotate_interval is not None and
+                monotonic() - self._opened >= self.rotate_interval)
+
+    def _rotate(self):
+        self._file.close()
+        segment = '{p}.{t}'.format(p=self.path, t=time.strftime('%Y%m%d-%H%M%S'))
+        suffix = 0
+        while os.path.exists(segment) or os.path.exists(segment + '.gz'):
+            suffix += 1
+            segment = '{p}.{t}-{s}'.format(
+                p=self.path, t=time.strftime('%Y%m%d-%H%M%S'), s=suffix)
+        os.rename(self.path, segment)
+        self._open()
+
+        if self.compress:
+            compressor = threading.Thread(target=self._compress,
+                                          args=(segment,),
+                                          name='apputils-logfile-gzip')
+            compressor.daemon = True
+            compressor.start()
+            self._compressors = [c for c in self._compressors if c.is_alive()]
+            self._compressors.append(compressor)
+        else:
+            self._prune()
+
+    def _compress(self, segment):
+        part = segment + '.gz.part'
+        try:
+            with open(segment, 'rb') as source:
+                with gzip.open(part, 'wb') as target:
+                    shutil.copyfileobj(source, target, 1024 * 1024)
+            os.rename(part, segment + '.gz')
+            os.remove(segment)
+        except (IOError, OSError):
+            # (the segment went meanwhile, e.g. pruned by another process)
+            try:
+                os.remove(part)
+            except OSError:
+                pass
+        self._prune()
+
+    def _prune(self):
+        """Remove all but the newest ``backups`` rotated segments.
+
+        Only files named as ``_rotate`` names segments (``<name>.<time>``,
+        ``<name>.<time>-<n>``, either maybe with ``.gz``) are considered; they
+        are ordered by the time (and number) in their names.
+        """
+        directory, name = os.path.split(self.path)
+        pattern = re.compile(re.escape(name) +
+                             r'\.(\d{8}-\d{6})(?:-(\d+))?(?:\.gz)?$')
+        try:
+            entries = os.listdir(directory or os.curdir)
+        except OSError:
+            return
+        segments = []
+        for entry in entries:
+            match = pattern.match(entry)
+            if match is not None:
+                segments.append(((match.group(1), int(match.group(2) or 0)),
+                                 os.path.join(directory, entry)))
+        segments.sort()
+        for _, path in segments[:max(len(segments) - self.backups, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # (being compressed, or already gone)
+
+    def flush(self):
+        """Write the current batch to the file now."""
+        self._write_batch()
+
+    def close(self):
+        """Write what is left, wait for any compression, and close the file."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._writer.join()
+        for compressor in self._compressors:
+            compressor.join()
+        with self._file_lock:
+            if self.fsync != 'never':
+                os.fsync(self._file.fileno())
+            self._file.close()
+        logging.Handler.close(self)
@@ -22,7 +22,7 @@ upgrade_namespace(globals())
 
 __all__ = ("Namespace", "as_namespace")
 
-from collections import Mapping, Sequence, defaultdict
+from collections import defaultdict
 
 from .errors import ApputilsError
 
@@ -0,0 +1,490 @@
+# -*- coding: utf-8 -*-
+"""finucane.apputils.netlog
+
+Provides the batched netlogger transport: ``BatchingNetlogHandler``, a
+drop-in alternative to ``logging.handlers.SocketHandler`` for ``--netlogger``
+(see ``Application.netlog_transport``), and ``LocalReceiver``, a minimal
+in-process receiver for tests and benchmarks.
+
+Rather than pickling and sending each record on the logging thread, the
+handler appends the record (as a line of compact JSON) to a batch. Batches
+are cut when they reach ``batch_size`` bytes or are ``flush_interval``
+seconds old, compressed, and handed to one sender thread per endpoint.
+Senders (re)connect with exponential back-off; while an endpoint is down (or
+falling behind), its batches go to a bounded on-disk spool, which is replayed
+once the endpoint is back.
+
+Wire format: the connection starts with ``PREAMBLE``; then, each batch is a
+frame: a one byte codec, a four byte (big-endian) body length, and the body.
+The body is UTF-8 JSON lines, either plain (``CODEC_PLAIN``) or zlib
+compressed (``CODEC_ZLIB``); or, with ``record_format='binary'``, a
+self-contained ``binlog`` stream (``CODEC_BINARY``, ``CODEC_BINARY_ZLIB``).
+
+:copyright: (c) 2014 by Sean Anthony Finucane.
+:license: MIT, see LICENSE for more details.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+# Python 2.6 and newer support
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from finucane.apputils.compatibility import upgrade_namespace
+upgrade_namespace(globals())
+from finucane.apputils.compatibility import monotonic
+
+import os
+import io
+import json
+import zlib
+import pickle
+import socket
+import struct
+import logging
+import threading
+from collections import deque
+
+try:
+    import socketserver  # Python 3.x
+except ImportError:
+    import SocketServer as socketserver  # Python 2.x
+
+from .log import JsonLinesFormatter, make_record_encoder
+
+PREAMBLE = b'APUB\x01'
+CODEC_PLAIN = 0
+CODEC_ZLIB = 1
+CODEC_BINARY = 2
+CODEC_BINARY_ZLIB = 3
+
+FRAME_HEAD = struct.Struct('>BI')
+PICKLE_HEAD = struct.Struct('>L')  # ``SocketHandler`` framing
+
+
+def encode_frame(lines, compress=True, binary=False):
+    """Frame a list of encoded (bytes) JSON lines as one batch.
+
+    With ``binary``, ``lines`` are the frames of a ``binlog`` stream instead.
+    """
+    if binary:
+        body = b''.join(lines)
+        codec = CODEC_BINARY_ZLIB if compress else CODEC_BINARY
+    else:
+        body = b'\n'.join(lines)
+        codec = CODEC_ZLIB if compress else CODEC_PLAIN
+    if compress:
+        body = zlib.compress(body, 6)
+    return FRAME_HEAD.pack(codec, len(body)) + body
+
+
+def decode_body(codec, body):
+    """Return the JSON lines (bytes) carried by a batch body."""
+    if codec in (CODEC_ZLIB, CODEC_BINARY_ZLIB):
+        body = zlib.decompress(body)
+    elif codec not in (CODEC_PLAIN, CODEC_BINARY):
+        raise ValueError('unknown netlog codec: {0!r}'.format(codec))
+    if codec in (CODEC_BINARY, CODEC_BINARY_ZLIB):
+        from .binlog import to_json_lines
+        return to_json_lines(body)
+    return body.split(b'\n') if body else []
+
+
+class _RecordUnpickler(pickle.Unpickler):
+    """Unpickles ``SocketHandler`` payloads (plain dicts) and nothing else."""
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(
+            'refusing to unpickle {m}.{n}'.format(m=module, n=name))
+
+
+def unpickle_record(payload):
+    """Decode one ``SocketHandler`` payload into a dict of record attributes."""
+    return _RecordUnpickler(io.BytesIO(payload)).load()
+
+
+class BatchingNetlogHandler(logging.Handler):
+    """Sends records, in compressed batches, to one or more endpoints.
+
+    Attributes:
+        endpoints: The ``(host, port)`` addresses records are sent to.
+        record_format: 'jsonl' (records are formatted by the handler's
+            formatter), or 'binary' (``binlog``; the formatter's ``fields``
+            and ``static`` fields are encoded).
+        batch_size: A batch is sent once it holds this many bytes.
+        flush_interval: ... or once it is this many seconds old.
+    """
+    def __init__(self, endpoints, batch_size=65536, flush_interval=0.5,
+                 compress=True, max_queued=64, spool_dir=None,
+                 spool_max_bytes=64 * 1024 * 1024, formatter=None,
+                 record_format='jsonl'):
+        logging.Handler.__init__(self)
+        self.setFormatter(formatter or JsonLinesFormatter())
+        self.record_format = record_format
+        self._encoder = make_record_encoder(record_format, self.formatter)
+        self.endpoints = [tuple(endpoint) for endpoint in endpoints]
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compress = compress
+
+        self._lines = []
+        self._size = 0
+        self._oldest = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._senders = [_Sender(host, port, max_queued,
+                                 _make_spool(spool_dir, host, port,
+                                             spool_max_bytes))
+                         for host, port in self.endpoints]
+        self._batcher = threading.Thread(target=self._batch_until_closed,
+                                         name='apputils-netlog-batcher')
+        self._batcher.daemon = True
+        self._batcher.start()
+
+    @property
+    def dropped(self):
+        """The number of batches discarded, per endpoint."""
+        return dict((sender.address, sender.dropped) for sender in self._senders)
+
+    def emit(self, record):
+        if self._encoder is None:
+            try:
+                line = self.format(record).encode('utf-8')
+            except Exception:
+                self.handleError(record)
+                return
+        with self._condition:
+            if self._encoder is not None:
+                # (encoded with the lock held: the batch is one binlog stream)
+                try:
+                    if not self._lines:
+                        self._lines.append(self._encoder.header())
+                    line = self._encoder.encode(record)
+                except Exception:
+                    self.handleError(record)
+                    return
+            if self._oldest is None:
+                # a new batch: the batcher must start its flush_interval clock
+                self._oldest = monotonic()
+                self._condition.notify()
+            self._lines.append(line)
+            self._size += len(line) + 1
+            if self._size >= self.batch_size:
+                self._condition.notify()
+
+    def _take_batch(self):
+        """Cut the current batch (lock held)."""
+        lines = self._lines
+        self._lines = []
+        self._size = 0
+        self._oldest = None
+        return lines
+
+    def _batch_until_closed(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if self._size >= self.batch_size:
+                        break
+                    if self._oldest is not None:
+                        timeout = self._oldest + self.flush_interval - monotonic()
+                        if timeout <= 0:
+                            break
+                    else:
+                        timeout = None
+                    self._condition.wait(timeout)
+                lines = self._take_batch()
+                closed = self._closed
+            if lines:
+                self._dispatch(encode_frame(lines, self.compress,
+                                            self._encoder is not None))
+            if closed:
+                return
+
+    def _dispatch(self, frame):
+        for sender in self._senders:
+            sender.put(frame)
+
+    def flush(self):
+        """Send the current batch now (asynchronously)."""
+        with self._condition:
+            lines = self._take_batch()
+        if lines:
+            self._dispatch(encode_frame(lines, self.compress,
+                                        self._encoder is not None))
+
+    def close(self, timeout=5.0):
+        """Send what is left (waiting up to ``timeout`` seconds), then stop.
+
+        Whatever cannot be delivered by then stays in the spool (if any), to
+        be replayed by the next handler using the same spool directory.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._batcher.join()
+        for sender in self._senders:
+            sender.close(timeout)
+        logging.Handler.close(self)
+
+
+def _make_spool(spool_dir, host, port, max_bytes):
+    if spool_dir is None:
+        return None
+    if not os.path.isdir(spool_dir):
+        os.makedirs(spool_dir)
+    name = '{h}_{p}.spool'.format(h=str(host).replace(os.sep, '_'), p=port)
+    return _Spool(os.path.join(spool_dir, name), max_bytes)
+
+
+class _Spool(object):
+    """An append-only file of frames, bounded in size."""
+    def __init__(self, path, max_bytes):
+        object.__init__(self)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def append(self, frame):
+        """Returns False (and stores nothing) if the spool is full."""
+        with self._lock:
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            if size + len(frame) > self.max_bytes:
+                return False
+            with open(self.path, 'ab') as spool:
+                spool.write(frame)
+            return True
+
+    def take(self):
+        """Remove and return every spooled frame (as one byte string)."""
+        with self._lock:
+            if not os.path.exists(self.path):
+                return b''
+            with open(self.path, 'rb') as spool:
+                data = spool.read()
+            os.remove(self.path)
+            return data
+
+    def restore(self, data):
+        """Put ``data`` (from ``take``) back, ahead of anything spooled since."""
+        with self._lock:
+            newer = b''
+            if os.path.exists(self.path):
+                with open(self.path, 'rb') as spool:
+                    newer = spool.read()
+            with open(self.path, 'wb') as spool:
+                spool.write(data + newer)
+
+
+class _Sender(object):
+    """Delivers frames to one endpoint, from its own thread."""
+    MIN_BACKOFF = 0.1
+    MAX_BACKOFF = 30.0
+
+    def __init__(self, host, port, max_queued, spool):
+        object.__init__(self)
+        self.address = (host, port)
+        self.max_queued = max_queued
+        self.spool = spool
+        self.dropped = 0
+        self._queue = deque()
+        self._sock = None
+        self._backoff = self.MIN_BACKOFF
+        self._next_attempt = 0.0
+        self._closing = False
+        self._deadline = None
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._send_until_closed,
+            name='apputils-netlog-sender-{h}:{p}'.format(h=host, p=port))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, frame):
+        with self._condition:
+            if len(self._queue) < self.max_queued:
+                self._queue.append(frame)
+                self._condition.notify()
+                return
+        self._overflow(frame)  # falling behind: spool it, or drop it
+
+    def _overflow(self, frame):
+        if self.spool is None or not self.spool.append(frame):
+            self.dropped += 1
+
+    def _send_until_closed(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closing:
+                    self._condition.wait()
+                if not self._queue:
+                    break
+                frame = self._queue.popleft()
+            if not self._deliver(frame):
+                self._overflow(frame)
+            if self._closing and monotonic() > self._deadline:
+                break
+        with self._condition:
+            leftovers = list(self._queue)
+            self._queue.clear()
+        for frame in leftovers:
+            self._overflow(frame)
+        self._disconnect()
+
+    def _deliver(self, frame):
+        if not self._connect():
+            return False
+        try:
+            if self.spool is not None:
+                spooled = self.spool.take()
+                if spooled:
+                    try:
+                        self._sock.sendall(spooled)
+                    except (socket.error, OSError):
+                        self.spool.restore(spooled)
+                        raise
+            self._sock.sendall(frame)
+            return True
+        except (socket.error, OSError):
+            self._disconnect()
+            self._schedule_retry()
+            return False
+
+    def _connect(self):
+        if self._sock is not None:
+            return True
+        if monotonic() < self._next_attempt:
+            return False
+        try:
+            sock = socket.create_connection(self.address, timeout=5.0)
+            sock.sendall(PREAMBLE)
+        except (socket.error, OSError):
+            self._schedule_retry()
+            return False
+        self._sock = sock
+        self._backoff = self.MIN_BACKOFF
+        return True
+
+    def _schedule_retry(self):
+        self._next_attempt = monotonic() + self._backoff
+        self._backoff = min(self._backoff * 2, self.MAX_BACKOFF)
+
+    def _disconnect(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            finally:
+                self._sock = None
+
+    def close(self, timeout):
+        with self._condition:
+            self._closing = True
+            self._deadline = monotonic() + timeout
+            self._condition.notify()
+        self._thread.join()
+
+
+class LocalReceiver(object):
+    """A minimal, in-process netlogger receiver, for tests and benchmarks.
+
+    Accepts both the batched format and ``SocketHandler``'s pickle format,
+    and keeps every received record (as a dict) in ``records``.
+
+    Example::
+
+        receiver = LocalReceiver()  # listens on an ephemeral port
+        receiver.start()
+        ... log to ('localhost', receiver.port) ...
+        receiver.wait_for(100)
+        receiver.stop()
+    """
+    def __init__(self, host='localhost', port=0):
+        object.__init__(self)
+        self.records = []
+        self._condition = threading.Condition()
+        receiver = self
+
+        class _Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                for record in read_records(self.request):
+                    receiver._received(record)
+
+        self._server = socketserver.ThreadingTCPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = None
+
+    def _received(self, record):
+        with self._condition:
+            self.records.append(record)
+            self._condition.notify_all()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='apputils-netlog-receiver')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def wait_for(self, count, timeout=10.0):
+        """Wait until at least ``count`` records arrived; returns the count."""
+        deadline = monotonic() + timeout
+        with self._condition:
+            while len(self.records) < count:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return len(self.records)
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def read_records(sock):
+    """Yield the records (dicts) sent over a connection, in either format."""
+    head = _recv_exactly(sock, len(PREAMBLE))
+    if head is None:
+        return
+    if head == PREAMBLE:
+        while True:
+            frame_head = _recv_exactly(sock, FRAME_HEAD.size)
+            if frame_head is None:
+                return
+            codec, length = FRAME_HEAD.unpack(frame_head)
+            body = _recv_exactly(sock, length)
+            if body is None:
+                return
+            for line in decode_body(codec, body):
+                yield json.loads(line.decode('utf-8'))
+    else:
+        # ``SocketHandler``: a four byte length, then a pickled dict; the
+        # bytes already read are the length and the start of the payload.
+        pending = head
+        while True:
+            more = _recv_exactly(sock, PICKLE_HEAD.size - len(pending)) \
+                if len(pending) < PICKLE_HEAD.size else b''
+            if more is None:
+                return
+            pending += more
+            length = PICKLE_HEAD.unpack(pending[:PICKLE_HEAD.size])[0]
+            payload = pending[PICKLE_HEAD.size:]
+            rest = _recv_exactly(sock, length - len(payload))
+            if rest is None:
+                return
+            yield unpickle_record(payload + rest)
+            pending = b''
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
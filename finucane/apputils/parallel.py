@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""finucane.apputils.parallel
+
+Provides the ``ParallelRunner`` class, which runs batches of application jobs
+across a pool of worker processes.
+
+:copyright: (c) 2014 by Sean Anthony Finucane.
+:license: MIT, see LICENSE for more details.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+# Python 2.6 and newer support
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from finucane.apputils.compatibility import upgrade_namespace
+upgrade_namespace(globals())
+
+import pickle
+import logging
+import logging.handlers  # QueueHandler/QueueListener: Python 3.2 and newer
+import multiprocessing
+
+from .application import RunOutcome, _split_job
+from .context import RunContext, activate, deactivate
+from .errors import ApplicationError
+from .args import portable_spec
+from .timing import TimingCollector
+
+
+# per-worker-process state, set up once by ``_init_worker``.
+_worker = {}
+
+
+class ParallelRunner(object):
+    """Runs application jobs in a pool of worker processes.
+
+    The application is pickled (see ``ApplicationBase.__getstate__``) and
+    shipped to each worker process once, when the worker starts. Jobs are then
+    sent to the workers in chunks. Log records emitted by the workers are sent
+    back to the parent process and written by the parent's stdlog/stderr
+    handlers, so output from different workers is never interleaved
+    mid-record.
+
+    Example::
+
+        runner = ParallelRunner(MyApp(), processes=4, chunksize=16)
+        outcomes = runner.run_many([['--flag', 'a'], ['b']], message='hi')
+
+    Attributes:
+        app: The application (in the parent process).
+        processes: The number of worker processes (default: CPU count).
+        chunksize: The number of jobs sent to a worker at a time.
+        ordered: If True, outcomes are returned in submission order;
+            otherwise, in completion order.
+    """
+    def __init__(self, app, processes=None, chunksize=1, ordered=True):
+        object.__init__(self)
+        self.app = app
+        self.processes = processes
+        self.chunksize = chunksize
+        self.ordered = ordered
+
+    def run_many(self, jobs, *args, **kwargs):
+        """Parallel counterpart of ``Application.run_many``.
+
+        Returns:
+            A list of ``RunOutcome`` instances. Each outcome's ``index`` is
+            the position of its job in ``jobs``.
+        """
+        app = self.app
+        pickled_app = pickle.dumps(app)
+        _check_rehydration(app, pickled_app)
+        log_queue = multiprocessing.Queue()
+        pool = multiprocessing.Pool(
+            self.processes, initializer=_init_worker,
+            initargs=(pickled_app, log_queue, args, kwargs,
+                      app.timing is not None))
+
+        listener = None
+        token = activate(RunContext(app))
+        try:
+            app._setup_logging()
+            handlers = [app._log_handler] if app._log_handler is not None else []
+            listener = logging.handlers.QueueListener(
+                log_queue, *handlers, respect_handler_level=True)
+            listener.start()
+
+            tasks = ((index,) + tuple(_split_job(job))
+                     for index, job in enumerate(jobs))
+            if self.ordered:
+                results = pool.imap(_run_in_worker, tasks, self.chunksize)
+            else:
+                results = pool.imap_unordered(_run_in_worker, tasks,
+                                              self.chunksize)
+            outcomes = list(results)
+            if app.timing is not None:
+                for outcome in outcomes:
+                    if outcome.report is not None:
+                        app.timing.add(outcome.report)
+
+            pool.close()
+            pool.join()
+        finally:
+            pool.terminate()
+            if listener is not None:
+                listener.stop()
+            app._teardown_logging()
+            deactivate(token)
+            log_queue.close()
+
+        return outcomes
+
+
+def _check_rehydration(app, pickled_app):
+    """Make sure the workers' copies of ``app`` take the same arguments.
+
+    Raises:
+        ApplicationError: The rehydrated application's argument parser
+            differs from the original's (e.g., an option added after
+            construction, or by a subclass ``__init__`` which needs
+            arguments).
+    """
+    copy = pickle.loads(pickled_app)
+    if portable_spec(copy.arg_parser.spec) != portable_spec(app.arg_parser.spec):
+        raise ApplicationError(
+            'the unpickled application (as the workers would have it) does '
+            'not take the same arguments as {a!r}'.format(a=app.app_id))
+
+
+def _init_worker(pickled_app, log_queue, args, kwargs, timing):
+    """Pool initializer: rehydrate the application and route its logging."""
+    app = pickle.loads(pickled_app)
+    if timing:
+        # reports travel back with the outcomes, to the parent's collector
+        app.timing = TimingCollector()
+    # nothing is written to the worker's own streams; records go to the parent.
+    app.stdlog = None
+    app.stderr = None
+    app._setup_logging()
+    app._log_sink().addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _worker['app'] = app
+    _worker['args'] = args
+    _worker['kwargs'] = kwargs
+
+
+def _run_in_worker(task):
+    index, argv, job_kwargs = task
+    app = _worker['app']
+    main_kwargs = dict(_worker['kwargs'])
+    main_kwargs.update(job_kwargs)
+    report = app._start_report(argv)
+    try:
+        outcome = app._run_job(argv, _worker['args'], main_kwargs, report)
+    except SystemExit as e:
+        outcome = RunOutcome(argv, exit_status=e.code)
+    except Exception as e:
+        outcome = RunOutcome(argv, error=e)
+    outcome.index = index
+    app._finish_report(report, outcome)
+    return _portable(outcome)
+
+
+def _portable(outcome):
+    """Make sure ``outcome`` survives the trip back to the parent process."""
+    for attr in ('result', 'error'):
+        try:
+            pickle.dumps(getattr(outcome, attr))
+        except Exception:
+            value = getattr(outcome, attr)
+            setattr(outcome, attr, ApplicationError(
+                'unpicklable {a}: {v!r}'.format(a=attr, v=value)))
+    return outcome
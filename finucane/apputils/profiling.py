@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""finucane.apputils.profiling
+
+Provides the profilers behind the standard ``--profile`` option: a
+deterministic one (``cProfile``, written as ``pstats`` data) and a low
+overhead, stack-sampling one (written as collapsed stacks, the input format
+of flame graph tools).
+
+:copyright: (c) 2014 by Sean Anthony Finucane.
+:license: MIT, see LICENSE for more details.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+# Python 2.6 and newer support
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from finucane.apputils.compatibility import upgrade_namespace
+upgrade_namespace(globals())
+
+import sys
+import threading
+from collections import defaultdict
+
+PROFILERS = ['cprofile', 'sampling']
+
+
+def make_profiler(kind, output_path):
+    """Create a (not yet started) profiler of the given kind.
+
+    Args:
+        kind: One of ``PROFILERS``.
+        output_path: Where the profile is written, when the profiler stops.
+    """
+    if kind == 'sampling':
+        return SamplingProfiler(output_path)
+    return DeterministicProfiler(output_path)
+
+
+class DeterministicProfiler(object):
+    """Profiles the calling thread with ``cProfile``; writes ``pstats`` data."""
+    def __init__(self, output_path):
+        object.__init__(self)
+        self.output_path = output_path
+        self._profile = None
+
+    def start(self):
+        import cProfile
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+        self._profile.dump_stats(self.output_path)
+
+
+class SamplingProfiler(object):
+    """Samples the calling thread's stack from a background thread.
+
+    Every ``interval`` seconds, the stack of the thread which called ``start``
+    is recorded. On ``stop``, the samples are written as collapsed stacks: one
+    line per distinct stack, outermost frame first, frames separated by
+    semicolons, followed by the number of samples.
+
+    Attributes:
+        interval: Seconds between samples.
+        samples: A dict mapping each collapsed stack to its sample count.
+    """
+    def __init__(self, output_path, interval=0.005):
+        object.__init__(self)
+        self.output_path = output_path
+        self.interval = interval
+        self.samples = defaultdict(int)
+        self._target = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._target = threading.current_thread().ident
+        self._thread = threading.Thread(target=self._sample_until_stopped,
+                                        name='apputils-sampling-profiler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        with open(self.output_path, 'w') as output:
+            for stack, count in sorted(self.samples.items()):
+                output.write('{s} {c}\n'.format(s=stack, c=count))
+
+    def _sample_until_stopped(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is not None:
+                self.samples[_collapse(frame)] += 1
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('{n} ({f}:{l})'.format(n=code.co_name,
+                                            f=code.co_filename,
+                                            l=code.co_firstlineno))
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join(names)
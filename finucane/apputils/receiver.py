@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""finucane.apputils.receiver
+
+Provides the netlogger receiver daemon: an asyncio server which ingests
+records from many ``--netlogger`` senders at once (``SocketHandler`` pickles,
+and the batched format of ``finucane.apputils.netlog``), and appends them to
+rotating JSON lines files. Run it with::
+
+    python -m finucane.apputils.receiver --port 9020 --directory /var/log/apps -vvv
+
+Ingest statistics (rate, and the lag between a record's creation and its
+arrival) are written to stdout, as a JSON line, every ``--stats-interval``
+seconds (whatever the log level).
+
+.. note: This module requires Python 3.5 or newer.
+
+:copyright: (c) 2014 by Sean Anthony Finucane.
+:license: MIT, see LICENSE for more details.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+
+from .application import Application
+from .compatibility import monotonic
+from .netlog import (PREAMBLE, FRAME_HEAD, PICKLE_HEAD, decode_body,
+                     unpickle_record)
+
+
+class RotatingJsonlWriter(object):
+    """Appends JSON lines to a file, rotating it by size.
+
+    Writes are buffered (``buffer_size`` bytes); call ``flush`` to push them
+    to the operating system. When the file would exceed ``max_bytes``, it is
+    renamed to ``<path>.1`` (shifting older ones up to ``<path>.<backups>``)
+    and a new file is started.
+    """
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, backups=5,
+                 buffer_size=1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.buffer_size = buffer_size
+        self._file = None
+        self._size = 0
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, 'ab', buffering=self.buffer_size)
+        self._size = self._file.tell()
+
+    def write_lines(self, lines):
+        data = b'\n'.join(lines) + b'\n'
+        if self._size and self._size + len(data) > self.max_bytes:
+            self.rotate()
+        self._file.write(data)
+        self._size += len(data)
+
+    def rotate(self):
+        self._file.close()
+        for index in range(self.backups - 1, 0, -1):
+            older = '{p}.{i}'.format(p=self.path, i=index)
+            if os.path.exists(older):
+                os.replace(older, '{p}.{i}'.format(p=self.path, i=index + 1))
+        if self.backups > 0:
+            os.replace(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class IngestStats(object):
+    """Counters for ingested records, and the lag of sampled records."""
+    def __init__(self):
+        self.records = 0
+        self.connections = 0
+        self.started = monotonic()
+        self._window_start = self.started
+        self._window_records = 0
+        self._lag_total = 0.0
+        self._lag_count = 0
+        self._lag_max = 0.0
+
+    def add(self, count, created=None):
+        self.records += count
+        self._window_records += count
+        if created is not None:
+            lag = time.time() - created
+            self._lag_total += lag
+            self._lag_count += 1
+            self._lag_max = max(self._lag_max, lag)
+
+    def window_elapsed(self):
+        """Seconds since the previous snapshot (or since the start)."""
+        return monotonic() - self._window_start
+
+    def snapshot(self):
+        """Statistics since the previous snapshot (and totals); resets them."""
+        now = monotonic()
+        elapsed = (now - self._window_start) or 1e-9
+        snapshot = {
+            'records': self.records,
+            'connections': self.connections,
+            'rate': self._window_records / elapsed,
+            'lag_mean': (self._lag_total / self._lag_count
+                         if self._lag_count else None),
+            'lag_max': self._lag_max if self._lag_count else None,
+        }
+        self._window_start = now
+        self._window_records = 0
+        self._lag_total = 0.0
+        self._lag_count = 0
+        self._lag_max = 0.0
+        return snapshot
+
+
+class NetlogReceiver(object):
+    """Accepts netlogger connections, and hands their records to a writer.
+
+    Records arriving in batches are written as received (they already are
+    JSON lines); only the last line of each batch is decoded, to sample the
+    lag. Pickled records are decoded and re-encoded as JSON.
+
+    Attributes:
+        stats: The receiver's ``IngestStats``.
+    """
+    def __init__(self, writer, host='0.0.0.0', port=9020):
+        self.writer = writer
+        self.host = host
+        self.port = port
+        self.stats = IngestStats()
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port, limit=1024 * 1024)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        self.writer.flush()
+
+    async def _handle(self, reader, writer):
+        self.stats.connections += 1
+        try:
+            head = await reader.readexactly(len(PREAMBLE))
+            if head == PREAMBLE:
+                await self._read_batches(reader)
+            else:
+                await self._read_pickles(reader, head)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # the sender went away
+        finally:
+            self.stats.connections -= 1
+            writer.close()
+
+    async def _read_batches(self, reader):
+        while True:
+            codec, length = FRAME_HEAD.unpack(
+                await reader.readexactly(FRAME_HEAD.size))
+            lines = decode_body(codec, await reader.readexactly(length))
+            if not lines:
+                continue
+            self.writer.write_lines(lines)
+            self.stats.add(len(lines), _created(lines[-1]))
+
+    async def _read_pickles(self, reader, head):
+        # the preamble-sized bytes already read: the length, and more
+        pending = head
+        while True:
+            if len(pending) < PICKLE_HEAD.size:
+                pending += await reader.readexactly(PICKLE_HEAD.size - len(pending))
+            length = PICKLE_HEAD.unpack(pending[:PICKLE_HEAD.size])[0]
+            payload = pending[PICKLE_HEAD.size:]
+            payload += await reader.readexactly(length - len(payload))
+            pending = b''
+            record = unpickle_record(payload)
+            self.writer.write_lines([json.dumps(
+                record, separators=(',', ':'), default=repr).encode('utf-8')])
+            self.stats.add(1, record.get('created'))
+
+
+def _created(line):
+    try:
+        return json.loads(line.decode('utf-8')).get('created')
+    except (ValueError, AttributeError):
+        return None
+
+
+class ReceiverApplication(Application):
+    """The ``python -m finucane.apputils.receiver`` command line tool."""
+    def __init__(self, **kwargs):
+        super().__init__(
+            name='apputils-netlog-receiver',
+            description='Receives netlogger records, and writes them to rotating JSON lines files.',
+            **kwargs)
+
+        self.arg_parser.add_option(
+            'host', default='0.0.0.0', help_='the address to listen on')
+        self.arg_parser.add_option(
+            'port', default=9020, type_=int, help_='the port to listen on')
+        self.arg_parser.add_option(
+            'directory', default='.', help_='where the log files are written')
+        self.arg_parser.add_option(
+            'file name', default='netlog.jsonl', help_='the name of the (current) log file')
+        self.arg_parser.add_option(
+            'max bytes', default=64 * 1024 * 1024, type_=int,
+            help_='the size at which the log file is rotated')
+        self.arg_parser.add_option(
+            'backups', default=5, type_=int, help_='the number of rotated files kept')
+        self.arg_parser.add_option(
+            'stats interval', default=10.0, type_=float,
+            help_='seconds between ingest statistics reports, written to stdout '
+                  'as JSON lines (and buffer flushes)')
+
+    async def _main(self):
+        writer = RotatingJsonlWriter(
+            os.path.join(self.args.directory[-1], self.args.file_name[-1]),
+            max_bytes=self.args.max_bytes[-1], backups=self.args.backups[-1])
+        receiver = NetlogReceiver(writer, host=self.args.host[-1],
+                                  port=self.args.port[-1])
+        await receiver.start()
+        self.log.info('Listening on %s:%s', receiver.host, receiver.port)
+
+        reporter = asyncio.ensure_future(self._report(receiver))
+        try:
+            await receiver.serve_forever()
+        finally:
+            reporter.cancel()
+            receiver.close()
+            writer.close()
+
+    async def _report(self, receiver):
+        interval = self.args.stats_interval[-1]
+        while True:
+            await asyncio.sleep(min(interval, 1.0))
+            receiver.writer.flush()
+            if receiver.stats.window_elapsed() >= interval:
+                # (the tool's output: on stdout, whatever the log level)
+                self.print(json.dumps(receiver.stats.snapshot()), flush=True)
+
+
+def main(argv=None):
+    app = ReceiverApplication()
+    try:
+        outcome = asyncio.run(app.run_async(sys.argv[1:] if argv is None else argv))
+    except KeyboardInterrupt:
+        return 0
+    return outcome.exit_status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+"""finucane.apputils.server
+
+Provides the ``ApplicationServer`` class, which keeps a warm application
+instance resident behind a Unix domain socket. Each invocation, made with
+``finucane.apputils.client``, then costs neither interpreter start-up, nor
+imports, nor argument parser construction; only the run itself.
+
+:copyright: (c) 2014 by Sean Anthony Finucane.
+:license: MIT, see LICENSE for more details.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+# Python 2.6 and newer support
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from finucane.apputils.compatibility import upgrade_namespace
+upgrade_namespace(globals())
+
+import os
+import sys
+import gc
+import codecs
+import json
+import signal
+import multiprocessing
+import threading
+import traceback
+
+try:
+    import socketserver  # Python 3.x
+except ImportError:
+    import SocketServer as socketserver  # Python 2.x
+
+from .client import (send_frame, recv_frame, CH_HEADER, CH_STDIN,
+                     CH_STDIN_EOF, CH_STDOUT, CH_STDERR, CH_EXIT)
+from .context import RunContext, activate, deactivate
+
+
+class ApplicationServer(object):
+    """Serves runs of one application instance over a Unix domain socket.
+
+    By default, requests are served one at a time, in the server process:
+    the working directory, environment and ``sys`` streams are swapped in for
+    each run (they are process-wide), and the application's ``state`` carries
+    over from run to run. With ``forking=True``, each request is served in a
+    forked child instead; requests then run concurrently, at the cost of a
+    fork per request, and state changes do not carry over.
+
+    Attributes:
+        app: The (warm) application instance.
+        socket_path: The filesystem path of the listening socket.
+    """
+    def __init__(self, app, socket_path, forking=False, args=(), kwargs=None):
+        object.__init__(self)
+        self.app = app
+        self.socket_path = socket_path
+        self.args = tuple(args)
+        self.kwargs = {} if kwargs is None else dict(kwargs)
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # stale, from a previous server
+
+        server_class = socketserver.UnixStreamServer
+        if forking:
+            server_class = _ForkingUnixStreamServer
+        self._server = server_class(socket_path, self._make_handler())
+
+    def _make_handler(self):
+        server = self
+
+        class _Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                server.handle(self.request)
+
+        return _Handler
+
+    def serve_forever(self, poll_interval=0.5):
+        self._server.serve_forever(poll_interval)
+
+    def shutdown(self):
+        """Stop ``serve_forever`` (call from another thread)."""
+        self._server.shutdown()
+
+    def server_close(self):
+        self._server.server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def handle(self, conn):
+        """Serve one client connection (one run)."""
+        channel, payload = recv_frame(conn)
+        if channel != CH_HEADER:
+            return
+        request = json.loads(payload.decode('utf-8'))
+
+        lock = threading.Lock()
+        stdin = _RemoteInput(conn)
+        stdout = _RemoteOutput(conn, CH_STDOUT, lock)
+        stderr = _RemoteOutput(conn, CH_STDERR, lock)
+
+        status = 1
+        with _process_environment(request, stdout, stderr):
+            try:
+                status = self._run(request['argv'], stdin, stdout, stderr)
+            except Exception:
+                traceback.print_exc(file=stderr)
+        send_frame(conn, CH_EXIT, str(status).encode('ascii'))
+
+    def _run(self, argv, stdin, stdout, stderr):
+        app = self.app
+        overrides = {'stdin': stdin, 'stdout': stdout}
+        if app.stderr is not None:
+            overrides['stderr'] = stderr
+        if app.stdlog is not None:
+            overrides['stdlog'] = stderr
+
+        token = activate(RunContext(app, **overrides))
+        try:
+            return app.run(argv, *self.args, **self.kwargs).exit_status
+        except SystemExit as e:
+            return _exit_status(e.code, stderr)
+        finally:
+            deactivate(token)
+
+
+class PreforkServer(ApplicationServer):
+    """Serves runs from a pool of pre-forked worker processes.
+
+    The master process binds the socket and then forks ``workers`` workers,
+    which share the master's warm state (imported modules, the application
+    instance, its argument parser and default configuration) copy-on-write,
+    and take turns accepting connections on the shared socket. Each worker
+    serves requests one at a time, as ``ApplicationServer`` does.
+
+    A worker is retired (and replaced by a fresh fork of the master) after
+    ``max_runs`` runs, or once its resident set has grown by more than
+    ``max_rss_growth`` bytes; either limit may be None (no limit).
+
+    Example::
+
+        server = PreforkServer(MyApp(), '/tmp/myapp.sock', workers=8,
+                               max_runs=1000)
+        server.serve_forever()  # until SIGTERM/SIGINT
+    """
+    def __init__(self, app, socket_path, workers=None, max_runs=None,
+                 max_rss_growth=None, args=(), kwargs=None):
+        ApplicationServer.__init__(self, app, socket_path, forking=False,
+                                   args=args, kwargs=kwargs)
+        self.workers = workers or multiprocessing.cpu_count()
+        self.max_runs = max_runs
+        self.max_rss_growth = max_rss_growth
+        self._pids = set()
+        self._stopping = False
+
+    def serve_forever(self, poll_interval=None):
+        """Fork the workers, and keep the pool full until ``shutdown``.
+
+        Once the workers are gone, the socket is closed (and its file
+        removed), as by ``server_close``.
+        """
+        previous = {}
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            previous[signum] = signal.signal(signum, self._on_signal)
+
+        # (built once, here, rather than after the fork by every worker)
+        self.app._warm()
+
+        if hasattr(gc, 'freeze'):  # Python 3.7 and newer
+            # keep the collector from touching (and so copying) warm objects
+            gc.collect()
+            gc.freeze()
+
+        try:
+            for _ in range(self.workers):
+                self._spawn()
+            while self._pids:
+                pid, _ = os.wait()
+                self._pids.discard(pid)
+                if not self._stopping:
+                    self._spawn()
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+            self.server_close()
+
+    def shutdown(self):
+        """Stop the workers; ``serve_forever`` returns once they are gone."""
+        self._stopping = True
+        for pid in list(self._pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                self._pids.discard(pid)
+
+    def _on_signal(self, signum, frame):
+        self.shutdown()
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid:
+            self._pids.add(pid)
+            return
+        # in the worker
+        status = 0
+        try:
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, signal.SIG_DFL)
+            self._work()
+        except Exception:
+            traceback.print_exc()
+            status = 1
+        finally:
+            os._exit(status)
+
+    def _work(self):
+        baseline = _rss()
+        runs = 0
+        while self.max_runs is None or runs < self.max_runs:
+            self._server.handle_request()
+            runs += 1
+            if (self.max_rss_growth is not None and
+                    _rss() - baseline > self.max_rss_growth):
+                break
+
+
+def _rss():
+    """The resident set size of this process, in bytes (0 if unknown)."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # peak (not current) RSS; kilobytes on Linux, bytes on Mac OS X
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+class _ForkingUnixStreamServer(socketserver.ForkingMixIn,
+                               socketserver.UnixStreamServer):
+    pass
+
+
+class _process_environment(object):
+    """Swap in the client's cwd, environment and ``sys`` streams, for a run."""
+    def __init__(self, request, stdout, stderr):
+        object.__init__(self)
+        self._request = request
+        self._stdout = stdout
+        self._stderr = stderr
+
+    def __enter__(self):
+        self._saved = (os.getcwd(), dict(os.environ), sys.stdout, sys.stderr)
+        os.environ.clear()
+        os.environ.update(self._request.get('env', {}))
+        os.chdir(self._request.get('cwd', self._saved[0]))
+        # ``argparse`` writes its help and errors straight to ``sys``.
+        sys.stdout = self._stdout
+        sys.stderr = self._stderr
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        cwd, environ, sys.stdout, sys.stderr = self._saved
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(environ)
+
+
+def _exit_status(code, stderr):
+    """Translate a ``SystemExit`` code into an exit status."""
+    if code is None:
+        return 0
+    try:
+        return int(code)
+    except (TypeError, ValueError):
+        print(code, file=stderr)
+        return 1
+
+
+class _RemoteOutput(object):
+    """A text stream which sends what is written to it to the client."""
+    encoding = 'utf-8'
+
+    def __init__(self, conn, channel, lock):
+        object.__init__(self)
+        self._conn = conn
+        self._channel = channel
+        self._lock = lock
+
+    def write(self, text):
+        if not text:
+            return 0
+        with self._lock:
+            send_frame(self._conn, self._channel, text.encode(self.encoding))
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class _RemoteInput(object):
+    """A text stream which reads the client's stdin, as it arrives.
+
+    Bytes are decoded incrementally, so a character split across frames
+    is kept (undecoded) until the rest of it arrives.
+    """
+    encoding = 'utf-8'
+
+    def __init__(self, conn):
+        object.__init__(self)
+        self._conn = conn
+        self._decoder = codecs.getincrementaldecoder(self.encoding)()
+        self._buffer = ''
+        self._eof = False
+
+    def _fill(self):
+        channel, payload = recv_frame(self._conn)
+        if channel == CH_STDIN:
+            self._buffer += self._decoder.decode(payload)
+            return
+        self._eof = True
+        if channel not in (CH_STDIN_EOF, None):  # (None: the connection is gone)
+            raise IOError('unexpected frame from the client: {0!r}'.format(channel))
+        self._buffer += self._decoder.decode(b'', True)
+
+    def read(self, size=-1):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            self._fill()
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self):
+        while not self._eof and '\n' not in self._buffer:
+            self._fill()
+        end = self._buffer.find('\n') + 1 or len(self._buffer)
+        data, self._buffer = self._buffer[:end], self._buffer[end:]
+        return data
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    next = __next__  # Python 2.x
+
+    def isatty(self):
+        return False
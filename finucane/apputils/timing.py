@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""finucane.apputils.timing
+
+Provides per-phase timing of the application lifecycle: a ``RunReport`` for
+each run, and a ``TimingCollector`` which aggregates the reports of many runs
+into per-phase histograms (and, optionally, writes each report out as a line
+of JSON).
+
+Timing is off unless a collector is assigned to the application::
+
+    app.timing = TimingCollector(stream=open('runs.jsonl', 'a'))
+    app.run_many(jobs)
+    print(app.timing.to_json())
+
+:copyright: (c) 2014 by Sean Anthony Finucane.
+:license: MIT, see LICENSE for more details.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+# Python 2.6 and newer support
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from finucane.apputils.compatibility import upgrade_namespace
+upgrade_namespace(globals())
+from finucane.apputils.compatibility import monotonic
+
+import json
+import threading
+import time
+
+
+class RunReport(object):
+    """The phase timings of a single run (or of a batch's shared set-up).
+
+    Attributes:
+        app_id: The application's ``app_id``.
+        argv: The run's arguments (None for a batch).
+        start_time: The wall-clock time (``time.time``) the report started.
+        phases: A list of ``(phase, seconds)`` tuples, in order.
+        exit_status: The run's exit status, once known.
+    """
+    def __init__(self, app_id, argv=None):
+        object.__init__(self)
+        self.app_id = app_id
+        self.argv = argv
+        self.start_time = time.time()
+        self.phases = []
+        self.exit_status = None
+        self._started = self._lap = monotonic()
+        self._finished = None
+
+    def mark(self, phase):
+        """Record the time since the previous mark (or start) as ``phase``."""
+        now = monotonic()
+        self.phases.append((phase, now - self._lap))
+        self._lap = now
+
+    def lap(self):
+        """Start timing the next phase now, discarding the time until now."""
+        self._lap = monotonic()
+
+    def finish(self):
+        self._finished = monotonic()
+
+    @property
+    def total(self):
+        """Seconds from start to finish (or until now, if not finished)."""
+        end = self._finished if self._finished is not None else monotonic()
+        return end - self._started
+
+    def as_dict(self):
+        return {'app_id': self.app_id,
+                'argv': self.argv,
+                'start_time': self.start_time,
+                'total': self.total,
+                'exit_status': self.exit_status,
+                'phases': [{'phase': phase, 'seconds': seconds}
+                           for phase, seconds in self.phases]}
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), sort_keys=True)
+
+    def __repr__(self):
+        return 'RunReport({0})'.format(', '.join(
+            '{p}={s:.6f}'.format(p=phase, s=seconds)
+            for phase, seconds in self.phases))
+
+
+class _NullReport(object):
+    """Stands in for a ``RunReport`` when timing is off; does nothing."""
+    def mark(self, phase):
+        pass
+
+    def lap(self):
+        pass
+
+    def finish(self):
+        pass
+
+
+NULL_REPORT = _NullReport()
+
+
+class PhaseHistogram(object):
+    """A histogram of durations, with power-of-two microsecond buckets.
+
+    Bucket ``i`` counts durations of less than ``2**i`` microseconds (and at
+    least ``2**(i-1)``, for ``i`` > 0).
+    """
+    def __init__(self):
+        object.__init__(self)
+        self.buckets = []
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, seconds):
+        index = int(seconds * 1e6).bit_length()
+        if index >= len(self.buckets):
+            self.buckets.extend([0] * (index + 1 - len(self.buckets)))
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        if self.minimum is None or seconds < self.minimum:
+            self.minimum = seconds
+        if self.maximum is None or seconds > self.maximum:
+            self.maximum = seconds
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, percent):
+        """An upper bound (in seconds) on the given percentile."""
+        if not self.count:
+            return None
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min((2 ** index) / 1e6, self.maximum)
+        return self.maximum
+
+    def as_dict(self):
+        return {'count': self.count,
+                'total': self.total,
+                'min': self.minimum,
+                'max': self.maximum,
+                'mean': self.mean,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99),
+                'buckets_us': dict((2 ** index, count)
+                                   for index, count in enumerate(self.buckets)
+                                   if count)}
+
+
+class TimingCollector(object):
+    """Aggregates ``RunReport``s into a ``PhaseHistogram`` per phase.
+
+    Safe to share between threads (e.g., concurrent runs of one instance).
+
+    Attributes:
+        stream: If not None, each report is written to it as a JSON line.
+        histograms: A dict mapping each phase to its ``PhaseHistogram``.
+    """
+    def __init__(self, stream=None):
+        object.__init__(self)
+        self.stream = stream
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def add(self, report):
+        with self._lock:
+            for phase, seconds in report.phases:
+                histogram = self.histograms.get(phase)
+                if histogram is None:
+                    histogram = self.histograms[phase] = PhaseHistogram()
+                histogram.add(seconds)
+            if self.stream is not None:
+                self.stream.write(report.to_json() + '\n')
+
+    def summary(self):
+        """Per-phase statistics, as a dict."""
+        with self._lock:
+            return dict((phase, histogram.as_dict())
+                        for phase, histogram in self.histograms.items())
+
+    def to_json(self):
+        return json.dumps(self.summary(), sort_keys=True)
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""finucane.apputils.watch
+
+Provides ``ConfigWatcher``, which notices when a config file changes (with
+inotify on Linux, or else by polling its modification time and size),
+re-parses it, and reports what changed (a ``ConfigDiff``). This is what lets a
+long running ``Application`` pick up config edits without a restart (see
+``Application.config_reload_interval`` and ``_on_config_change``).
+
+:copyright: (c) 2014 by Sean Anthony Finucane.
+:license: MIT, see LICENSE for more details.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+# Python 2.6 and newer support
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from finucane.apputils.compatibility import upgrade_namespace
+upgrade_namespace(globals())
+
+import os
+import sys
+import errno
+import select
+import struct
+import threading
+
+from .config import ApplicationConfig, file_stamp
+
+# inotify(7) events which may mean the file changed (editors often replace
+# the file, rather than writing to it, so the directory is watched)
+_IN_MODIFY = 0x002
+_IN_ATTRIB = 0x004
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_EVENTS = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_TO |
+              _IN_CREATE | _IN_DELETE)
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_EVENT_HEAD = struct.Struct('iIII')
+
+
+class ConfigDiff(object):
+    """What changed between two versions of a config.
+
+    Attributes:
+        added_sections: Names of the sections which are new.
+        removed_sections: Names of the sections which are gone.
+        changed: ``{section: {key: (old value, new value)}}``, for every key
+            which was added (old value None), removed (new value None) or
+            changed; sections which were added or removed are included.
+    """
+    def __init__(self, old, new):
+        object.__init__(self)
+        old = old.as_dict() if old is not None else {}
+        new = new.as_dict()
+        self.added_sections = sorted(set(new) - set(old))
+        self.removed_sections = sorted(set(old) - set(new))
+        self.changed = {}
+        for section in set(old) | set(new):
+            before = old.get(section, {})
+            after = new.get(section, {})
+            keys = dict((key, (before.get(key), after.get(key)))
+                        for key in set(before) | set(after)
+                        if before.get(key) != after.get(key))
+            if keys:
+                self.changed[section] = keys
+
+    def __bool__(self):
+        return bool(self.added_sections or self.removed_sections or self.changed)
+
+    __nonzero__ = __bool__  # Python 2.x
+
+    def __repr__(self):
+        return 'ConfigDiff(added_sections={a!r}, removed_sections={r!r}, ' \
+               'changed={c!r})'.format(a=self.added_sections,
+                                       r=self.removed_sections, c=self.changed)
+
+
+class ConfigWatcher(object):
+    """Watches a config file, on a background thread.
+
+    Whenever the file's modification time or size changes, it is parsed (by
+    ``factory``, ``ApplicationConfig`` by default) and compared with the
+    previous version; if anything differs, ``callback(config, diff)`` is
+    called, on the watcher's thread. A ``factory`` may return None to reject
+    a version (e.g., an invalid one), which keeps the previous one current.
+
+    Attributes:
+        path: The config file watched.
+        interval: Seconds between checks, when polling.
+        using_inotify: Whether inotify is in use (rather than polling).
+    """
+    def __init__(self, path, callback, current=None, interval=1.0,
+                 factory=ApplicationConfig, use_inotify=True):
+        object.__init__(self)
+        self.path = os.path.abspath(path)
+        self.callback = callback
+        self.interval = interval
+        self.factory = factory
+        self._current = current
+        self._stamp = file_stamp(self.path)
+        self._stopped = threading.Event()
+        self._inotify = _Inotify.create(self.path) if use_inotify else None
+        self.using_inotify = self._inotify is not None
+        self._thread = threading.Thread(target=self._watch,
+                                        name='apputils-config-watcher')
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Stop watching; wait up to ``timeout`` seconds for the thread.
+
+        (The thread closes the inotify descriptors itself, as it exits, so
+        they stay valid while it is busy, e.g. in a slow callback.)
+        """
+        self._stopped.set()
+        if self._inotify is not None:
+            self._inotify.wake()
+        if self._thread.is_alive():
+            if self._thread is not threading.current_thread():
+                self._thread.join(timeout)
+        elif self._inotify is not None:
+            self._inotify.close()  # (never started, or already gone)
+
+    def check(self):
+        """Re-parse the file if it changed, and report any differences.
+
+        Returns:
+            The ``ConfigDiff`` reported, or None.
+        """
+        stamp = file_stamp(self.path)
+        if stamp == self._stamp:
+            return None
+        self._stamp = stamp
+        if stamp is None:
+            return None  # (gone, perhaps for a moment: keep the last version)
+        config = self.factory(self.path)
+        if config is None:
+            return None
+        diff = ConfigDiff(self._current, config)
+        self._current = config
+        if diff:
+            self.callback(config, diff)
+            return diff
+        return None
+
+    def _watch(self):
+        try:
+            while not self._stopped.is_set():
+                if self._inotify is not None:
+                    if not self._inotify.wait(self.interval, self._stopped):
+                        continue
+                    # let a burst of writes settle before reading the file
+                    self._stopped.wait(0.05)
+                    self._inotify.drain()
+                else:
+                    self._stopped.wait(self.interval)
+                if self._stopped.is_set():
+                    return
+                try:
+                    self.check()
+                except Exception:
+                    # (a half-written or invalid file: try again on the next change)
+                    import traceback
+                    traceback.print_exc(file=sys.stderr)
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
+
+
+class _Inotify(object):
+    """A minimal inotify(7) binding (via ``ctypes``), watching one file.
+
+    ``wait`` also returns as soon as ``wake`` is called (from any thread),
+    through a pipe which is selected along with the inotify descriptor.
+    """
+    def __init__(self, fd, name):
+        object.__init__(self)
+        self._fd = fd
+        self._name = name
+        self._wake_r, self._wake_w = os.pipe()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @classmethod
+    def create(cls, path):
+        """An ``_Inotify`` for ``path``, or None if inotify is unavailable."""
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                               use_errno=True)
+            fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+            if fd < 0:
+                return None
+            directory, name = os.path.split(path)
+            if libc.inotify_add_watch(fd, directory.encode(sys.getfilesystemencoding()),
+                                      _IN_EVENTS) < 0:
+                os.close(fd)
+                return None
+        except (OSError, AttributeError, ImportError):
+            return None
+        return cls(fd, name.encode(sys.getfilesystemencoding()))
+
+    def wait(self, timeout, stopped):
+        """Wait up to ``timeout`` seconds (or until ``wake``) for an event
+        about the file."""
+        try:
+            readable = select.select([self._fd, self._wake_r], [], [], timeout)[0]
+        except (OSError, select.error, ValueError):
+            stopped.wait(timeout)  # (closed)
+            return False
+        if self._wake_r in readable:
+            return False
+        return bool(readable) and self.drain()
+
+    def wake(self):
+        """Make a pending (or the next) ``wait`` return."""
+        with self._lock:
+            if not self._closed:
+                os.write(self._wake_w, b'!')
+
+    def drain(self):
+        """Read the pending events; True if any were about the file."""
+        relevant = False
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return relevant
+                raise
+            position = 0
+            while position < len(data):
+                _, _, _, length = _EVENT_HEAD.unpack_from(data, position)
+                position += _EVENT_HEAD.size
+                name = data[position:position + length].rstrip(b'\0')
+                position += length
+                relevant = relevant or name == self._name
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for fd in (self._fd, self._wake_r, self._wake_w):
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
@@ -45,10 +45,13 @@ def find_packages(root_path, prefix=""):
 with open('README.md') as file:
     long_description = file.read()
 
-REQ_PKGS_ALL = ['future']
+REQ_PKGS_ALL = []
+REQ_PKGS_PY2 = ['future']
 REQ_PKGS_PY26 = ['argparse']
 
 required_packages = REQ_PKGS_ALL
+if __python_version__['major'] < 3:
+    required_packages += REQ_PKGS_PY2
 if (__python_version__['major'], __python_version__['minor']) in [(2, 6)]:
     required_packages += REQ_PKGS_PY26
 
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""test_config.py
+
+Parsed config files are shared by every ``ApplicationConfig`` built from
+them (see ``config._parsed``): changing one config, by whatever means, must
+leave the others (and later loads of the file) as they were.
+
+:copyright: (c) 2014 by Sean Anthony Finucane.
+:license: MIT, see LICENSE for more details.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from finucane.apputils import config
+from finucane.apputils.config import ApplicationConfig
+
+CONTENT = '[DEFAULT]\nd = 0\n\n[a]\nx = 1\ny = 2\n\n[b]\nz = 3\n'
+
+
+class SharedParseTest(unittest.TestCase):
+    def setUp(self):
+        config.clear_cache()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'app.ini')
+        with open(self.path, 'w') as f:
+            f.write(CONTENT)
+        self.expected = ApplicationConfig(self.path).as_dict()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        config.clear_cache()
+
+    def assertUnchanged(self):
+        self.assertEqual(ApplicationConfig(self.path).as_dict(), self.expected)
+
+    @unittest.skipIf(sys.version_info < (3,), 'mapping access is Python 3.x')
+    def test_item_assignment(self):
+        changed = ApplicationConfig(self.path)
+        changed['a'] = {'z': '9'}
+        self.assertEqual(changed.as_dict()['a'], {'d': '0', 'z': '9'})
+        self.assertUnchanged()
+
+    @unittest.skipIf(sys.version_info < (3,), 'mapping access is Python 3.x')
+    def test_item_deletion(self):
+        changed = ApplicationConfig(self.path)
+        del changed['b']
+        self.assertNotIn('b', changed.as_dict())
+        self.assertUnchanged()
+
+    @unittest.skipIf(sys.version_info < (3,), 'mapping access is Python 3.x')
+    def test_section_proxy(self):
+        changed = ApplicationConfig(self.path)
+        changed['a']['x'] = '5'
+        del changed['a']['y']
+        self.assertUnchanged()
+
+    def test_defaults(self):
+        changed = ApplicationConfig(self.path)
+        changed.defaults()['d'] = '7'
+        self.assertEqual(changed.get('a', 'd'), '7')
+        self.assertUnchanged()
+
+    def test_methods(self):
+        changed = ApplicationConfig(self.path)
+        changed.set('a', 'x', '5')
+        changed.remove_option('a', 'y')
+        changed.remove_section('b')
+        changed.add_section('c')
+        self.assertUnchanged()
+
+    def test_as_dict(self):
+        changed = ApplicationConfig(self.path)
+        changed.as_dict()['a']['x'] = '5'
+        changed.as_dict()['c'] = {}
+        self.assertEqual(changed.as_dict(), self.expected)
+        self.assertEqual(changed.get('a', 'x'), '1')
+        self.assertUnchanged()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""test_fast_args.py
+
+``args.CompiledParser`` (the fast path of ``ArgumentParser.parse_args``) must
+give the very namespace ``argparse`` gives, and hand every argv it does not
+handle (help, errors, abbreviations, etc.) over to ``argparse``, so that the
+exit status and output are the same with and without it.
+
+:copyright: (c) 2014 by Sean Anthony Finucane.
+:license: MIT, see LICENSE for more details.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import io
+import os
+import sys
+import unittest
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from finucane.apputils import Application
+from finucane.apputils.args import CompiledParser
+
+# (the compiled parser must handle all of these itself)
+TYPICAL = [
+    ['input.txt', '2'],
+    ['-vv', '--config', 'app.ini', '--mode', 'fast', '-n', 'input.txt', '3'],
+    ['--label=a', '--label', 'b', '-lc', 'input.txt', '--count', '7', '1'],
+]
+
+CORPUS = TYPICAL + [
+    [], ['a'], ['a', '1'], ['a', '1', 'extra'], ['a', 'x'], ['a', '-1'],
+    ['a', '1', '-v', '-v', '--verbose'], ['-vnv', 'a', '1'], ['-nv', 'a', '1'],
+    ['a', '--label', 'x', '1'], ['--label', 'x', 'a', '1'],
+    ['a', '1', '--label'], ['a', '1', '--label', '-x'], ['a', '1', '--label='],
+    ['a', '1', '--mode', 'slow'], ['a', '1', '--mode=safe'],
+    ['a', '1', '--conf', 'x.ini'], ['a', '1', '--count', 'many'],
+    ['a', '1', '-l', ''], ['', '1'], ['a', '1', '-lx=y'], ['a', '1', '-x'],
+    ['a', '1', '--', 'b'], ['a', '--', '1'], ['@args.txt'], ['-h'],
+    ['a', '1', '--help'], ['-', '1'], ['a', '1', '-vlx'],
+    ['a', '1', '--dry-run=yes'], ['a', '1', '--no-such-option'],
+    ['a', '1', '--netlogger', 'localhost:9020'],
+    ['a', '1', '--profiler', 'sampling', '--profile', 'out.txt'],
+    ['a', '1', '--set', 'server.port=1', '--set', 'a.b=c'],
+    ['a', '1', '--set', 'server.port'], ['a', '1', '--set=port=1'],
+]
+
+
+def make_app():
+    app = Application(name='corpus', default_config_file='app.ini',
+                      profiling=True)
+    app.arg_parser.add_argument('input', help_='the file to read')
+    app.arg_parser.add_argument('level', type_=int, help_='how hard')
+    app.arg_parser.add_restricted_option(
+        'mode', choices=['safe', 'fast'], help_='how to run')
+    app.arg_parser.add_switch('dry run', unix_flag='n', help_='do nothing')
+    app.arg_parser.add_option('label', unix_flag='l',
+                              help_='labels for the run')
+    app.arg_parser.add_option('count', type_=int, default=1,
+                              help_='how many times')
+    return app
+
+
+def parse(arg_parser, argv):
+    """What parsing ``argv`` gives: the namespace, or the exit status; and
+    the output."""
+    stdout, stderr = io.StringIO(), io.StringIO()
+    try:
+        with contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(stderr):
+            result = vars(arg_parser.parse_args(argv))
+    except SystemExit as e:
+        result = ('exit', e.code)
+    return result, stdout.getvalue(), stderr.getvalue()
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'redirect_stderr: Python 3.5')
+class CompiledParserTest(unittest.TestCase):
+    def setUp(self):
+        self.app = make_app()
+        self.compiled = CompiledParser.compile(self.app.arg_parser.spec)
+        self.assertIsNotNone(self.compiled)
+
+    def test_typical_argvs_are_compiled(self):
+        for argv in TYPICAL:
+            self.assertIsNotNone(self.compiled.parse(argv), argv)
+
+    def test_same_namespaces(self):
+        for argv in CORPUS:
+            namespace = self.compiled.parse(argv)
+            if namespace is None:
+                continue  # (handed over to argparse)
+            expected = parse(self.app.arg_parser._arg_parser, argv)[0]
+            self.assertEqual(vars(namespace), expected, argv)
+
+    def test_same_exit_and_errors(self):
+        arg_parser = self.app.arg_parser
+        for argv in CORPUS:
+            arg_parser.fast = False
+            expected = parse(arg_parser, argv)
+            arg_parser.fast = True
+            self.assertEqual(parse(arg_parser, argv), expected, argv)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""test_import_time.py
+
+The cost of ``import finucane.apputils``, as reported by ``-X importtime``
+(Python ≥ 3.7), must stay within a budget, and the modules which are only
+needed on demand must not be imported with the package.
+
+Run from the repository root::
+
+    python -m unittest discover tests
+
+The budget (in milliseconds) can be set with ``APPUTILS_IMPORT_BUDGET_MS``.
+
+:copyright: (c) 2014 by Sean Anthony Finucane.
+:license: MIT, see LICENSE for more details.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import sys
+import unittest
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+BUDGET_MS = float(os.environ.get('APPUTILS_IMPORT_BUDGET_MS', 150))
+
+# (imported where they are used, not with the package; ``traceback``, also
+# rarely needed, cannot be deferred: ``logging`` itself imports it)
+DEFERRED = ['inspect', 'uuid', 'logging.handlers', 'orjson', 'random',
+            'hashlib']
+
+RUNS = 3
+
+
+def _python(*args):
+    process = subprocess.Popen((sys.executable,) + args, cwd=ROOT,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               universal_newlines=True)
+    out, err = process.communicate()
+    if process.returncode != 0:
+        raise AssertionError(err)
+    return out, err
+
+
+def _import_time_us():
+    """The cumulative import time of the package, in microseconds."""
+    err = _python('-X', 'importtime', '-c', 'import finucane.apputils')[1]
+    for line in err.splitlines():
+        fields = [field.strip() for field in line.split('|')]
+        if len(fields) == 3 and fields[2] == 'finucane.apputils':
+            return int(fields[1])
+    raise AssertionError('no import time for finucane.apputils in:\n' + err)
+
+
+@unittest.skipIf(sys.version_info < (3, 7), '-X importtime needs Python 3.7')
+class ImportTimeTest(unittest.TestCase):
+    def test_within_budget(self):
+        # (the best of a few runs: the others are mostly noise)
+        best = min(_import_time_us() for _ in range(RUNS)) / 1000.0
+        self.assertLessEqual(
+            best, BUDGET_MS, 'import finucane.apputils took {t:.1f} ms '
+            '(budget: {b:.1f} ms)'.format(t=best, b=BUDGET_MS))
+
+    def test_deferred_modules(self):
+        code = ('import sys; import finucane.apputils; '
+                'print(" ".join(m for m in {d!r} if m in sys.modules))')
+        imported = _python('-c', code.format(d=DEFERRED))[0].split()
+        for module in DEFERRED:
+            self.assertNotIn(module, imported, '{m} is imported along with '
+                             'finucane.apputils'.format(m=module))
+
+
+if __name__ == '__main__':
+    unittest.main()